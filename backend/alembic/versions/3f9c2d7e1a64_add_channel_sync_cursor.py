@@ -0,0 +1,36 @@
+"""add_channel_sync_cursor
+
+Revision ID: 3f9c2d7e1a64
+Revises: bb07433f4498
+Create Date: 2026-10-17 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2d7e1a64'
+down_revision: Union[str, Sequence[str], None] = 'bb07433f4498'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('channels', sa.Column('last_message_id', sa.BigInteger(), nullable=True))
+    # Инициализируем курсор по уже сохраненным постам, чтобы первый цикл не перекачивал историю
+    op.execute(
+        """
+        UPDATE channels SET last_message_id = p.max_id
+        FROM (SELECT channel_id, MAX(message_id) AS max_id FROM posts GROUP BY channel_id) AS p
+        WHERE channels.id = p.channel_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('channels', 'last_message_id')
@@ -0,0 +1,30 @@
+"""add_channel_peer
+
+Revision ID: 5d2b8e61c4f3
+Revises: c81e4a9f0b27
+Create Date: 2026-10-17 15:02:57.640391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2b8e61c4f3'
+down_revision: Union[str, Sequence[str], None] = 'c81e4a9f0b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('channels', sa.Column('peer_id', sa.BigInteger(), nullable=True))
+    op.add_column('channels', sa.Column('access_hash', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('channels', 'access_hash')
+    op.drop_column('channels', 'peer_id')
@@ -0,0 +1,28 @@
+"""add_channel_peer_account
+
+Revision ID: 9a47c3e5d812
+Revises: 5d2b8e61c4f3
+Create Date: 2026-10-17 16:21:08.114270
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a47c3e5d812'
+down_revision: Union[str, Sequence[str], None] = '5d2b8e61c4f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('channels', sa.Column('peer_account', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('channels', 'peer_account')
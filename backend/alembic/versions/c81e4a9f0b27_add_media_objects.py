@@ -0,0 +1,34 @@
+"""add_media_objects
+
+Revision ID: c81e4a9f0b27
+Revises: 3f9c2d7e1a64
+Create Date: 2026-10-17 12:40:08.118734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81e4a9f0b27'
+down_revision: Union[str, Sequence[str], None] = '3f9c2d7e1a64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('media_objects',
+    sa.Column('file_key', sa.String(length=64), nullable=False),
+    sa.Column('media', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('file_key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('media_objects')
@@ -0,0 +1,41 @@
+"""add_posts_keyset_index
+
+Revision ID: e6f1a2b9c305
+Revises: 9a47c3e5d812
+Create Date: 2026-10-17 18:40:12.503318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6f1a2b9c305'
+down_revision: Union[str, Sequence[str], None] = '9a47c3e5d812'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # posts — горячая таблица: CONCURRENTLY не блокирует запись, но не работает внутри транзакции.
+    # Индексы могли создать create_all() или не создать начальная миграция — отсюда IF [NOT] EXISTS
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_posts_channel_date_id', 'posts', ['channel_id', 'date', 'id'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        # (channel_id, date) — префикс нового индекса, отдельно он больше не нужен
+        op.drop_index('ix_posts_channel_date', table_name='posts', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_posts_channel_date', 'posts', ['channel_id', 'date'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_posts_channel_date_id', table_name='posts', postgresql_concurrently=True, if_exists=True)
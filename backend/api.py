@@ -4,11 +4,15 @@ import os
 import json
 import logging
 import asyncio
+import functools
+import socket
 import time
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Header, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from typing import AsyncGenerator, Optional
+from collections import defaultdict, OrderedDict
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from urllib.parse import parse_qsl, unquote
@@ -17,13 +21,16 @@ from database import requests as db
 from database import schemas
 from database.engine import create_db, session_maker
 from database.models import Post, Subscription # Убедимся, что Subscription импортирована
-from database.schemas import PostInFeed
+import timelines
+import feed_cache
+import compression
 # from worker import backfill_user_channels
 
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi_cache.decorator import cache
+from fastapi_cache.coder import Coder
 from redis import asyncio as aioredis
 
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -40,6 +47,21 @@ REDIS_URL = os.getenv("REDIS_URL") or os.getenv("REDIS_PUBLIC_URL")
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 IS_DEVELOPMENT = os.getenv("ENVIRONMENT") == "development"
 PAGE_SIZE = 20
+# initData старше TMA_MAX_AGE секунд (по auth_date) не принимается; 0 — без ограничения
+TMA_MAX_AGE = int(os.getenv("TMA_MAX_AGE", str(24 * 3600)))
+TMA_CACHE_SIZE = 10000
+# Секрет проверки initData зависит только от токена бота — считаем один раз
+WEBAPP_SECRET = hmac.new("WebAppData".encode(), BOT_TOKEN.encode(), hashlib.sha256).digest() if BOT_TOKEN else None
+SSE_HEARTBEAT_INTERVAL = 15
+SSE_QUEUE_SIZE = 100  # Пачек id на подключение; медленный клиент теряет лишнее, а не память процесса
+STATS_INTERVAL = 60
+API_INSTANCE_ID = os.getenv("API_INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+api_redis = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+# Предрассчитанные ленты в Redis (TIMELINE_STORE=true); без них лента читается из SQL
+timeline_redis = api_redis if timelines.TIMELINE_STORE else None
+background_tasks: set[asyncio.Task] = set()
+compression_stats = compression.CompressionStats()
 
 # --- ИНИЦИАЛИЗАЦИЯ APP ---
 app = FastAPI(title="Feed Reader API")
@@ -64,12 +86,49 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type"],
 )
+# Сжатие JSON-ответов; SSE проходит без сжатия и буферизации
+app.add_middleware(compression.CompressionMiddleware, stats=compression_stats)
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ АВТОРИЗАЦИИ ---
+def tma_expired(auth_date: int) -> bool:
+    return bool(TMA_MAX_AGE) and time.time() - auth_date > TMA_MAX_AGE
+
+class VerifiedInitDataCache:
+    """
+    LRU уже проверенных initData: sha256 строки -> (данные, auth_date).
+    Одна сессия Mini App присылает одну и ту же строку на каждый запрос,
+    поэтому повторный разбор и HMAC не нужны, пока не истек auth_date.
+    """
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[bytes, tuple[dict, int]] = OrderedDict()
+
+    def get(self, init_data: str) -> Optional[dict]:
+        key = hashlib.sha256(init_data.encode()).digest()
+        item = self._items.get(key)
+        if item is None:
+            return None
+        data, auth_date = item
+        if tma_expired(auth_date):
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return data
+
+    def put(self, init_data: str, data: dict, auth_date: int):
+        self._items[hashlib.sha256(init_data.encode()).digest()] = (data, auth_date)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+verified_init_data = VerifiedInitDataCache(TMA_CACHE_SIZE)
+
 def is_valid_tma_data(init_data: str) -> Optional[dict]:
-    if not BOT_TOKEN:
+    if not WEBAPP_SECRET:
         logging.critical("CRITICAL: BOT_TOKEN is not configured!")
         return None
+    cached = verified_init_data.get(init_data)
+    if cached is not None:
+        return cached
     try:
         # Декодируем URL-кодированную строку
         decoded_init_data = unquote(init_data)
@@ -77,43 +136,73 @@ def is_valid_tma_data(init_data: str) -> Optional[dict]:
         tma_hash = parsed_data.pop('hash')
         data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(parsed_data.items()))
         
-        secret_key = hmac.new("WebAppData".encode(), BOT_TOKEN.encode(), hashlib.sha256).digest()
-        calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+        calculated_hash = hmac.new(WEBAPP_SECRET, data_check_string.encode(), hashlib.sha256).hexdigest()
         
-        if calculated_hash == tma_hash:
-            return parsed_data
-        return None
+        if not hmac.compare_digest(calculated_hash, tma_hash):
+            return None
+        auth_date = int(parsed_data.get('auth_date', 0))
+        if tma_expired(auth_date):
+            return None
+        verified_init_data.put(init_data, parsed_data, auth_date)
+        return parsed_data
     except Exception as e:
         logging.error(f"TMA validation error: {e}")
         return None
 
-async def DYNAMIC_CACHE_CONTROL(response: Response):
+def get_auth_string(request: Request) -> Optional[str]:
+    # Сначала заголовок, потом query-параметр (EventSource не умеет слать заголовки)
+    return request.headers.get("authorization") or request.query_params.get("authorization")
+
+def authenticate_request(request: Request) -> Optional[int]:
     """
-    Эта зависимость добавляет заголовки, которые запрещают
-    браузеру/клиенту кэшировать ответ. Это заставляет его
-    всегда обращаться к нашему серверу за свежими данными.
+    Проверяет initData один раз за запрос: rate limiter и get_current_user_id
+    берут готовый результат из request.state.tma_user_id.
     """
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    if hasattr(request.state, "tma_user_id"):
+        return request.state.tma_user_id
+    user_id = None
+    auth_string = get_auth_string(request)
+    if auth_string and auth_string.startswith("tma "):
+        validated_data = is_valid_tma_data(auth_string.split(" ", 1)[1])
+        if validated_data and 'user' in validated_data:
+            try:
+                user_id = int(json.loads(validated_data['user'])['id'])
+            except (KeyError, TypeError, ValueError):
+                pass
+    request.state.tma_user_id = user_id
+    return user_id
+
+# Браузер хранит ленту, но каждый раз перепроверяет ее по ETag (If-None-Match -> 304)
+# Vary одинаковый у 200 и 304: ответ зависит и от пользователя, и от сжатия
+FEED_CACHE_HEADERS = {'Cache-Control': 'private, no-cache', 'Vary': 'Authorization, Accept-Encoding'}
+
+class FeedJSONResponse(JSONResponse):
+    """Ответ ленты, уже собранный schemas.serialize_post: orjson без повторной валидации."""
+    def render(self, content) -> bytes:
+        return schemas.dump_json(content)
+
+class FeedResponseCoder(Coder):
+    """В кеше лежат готовые байты ответа: попадание отдается без разбора и сериализации."""
+    @classmethod
+    def encode(cls, value) -> bytes:
+        return value.body
+
+    @classmethod
+    def decode(cls, value: bytes) -> Response:
+        return Response(content=value, media_type="application/json", headers=FEED_CACHE_HEADERS)
+
+def feed_response(posts: list[Post], status: str, next_cursor: Optional[str] = None) -> FeedJSONResponse:
+    content = {"posts": [schemas.serialize_post(post) for post in posts], "status": status, "next_cursor": next_cursor}
+    return FeedJSONResponse(content, headers=FEED_CACHE_HEADERS)
 
 def get_user_id_from_request(request: Request) -> str:
     # ИСПРАВЛЕНИЕ: Игнорируем OPTIONS запросы в rate limiter
     if request.method == "OPTIONS":
         return get_remote_address(request) # Для OPTIONS запросов используем IP
 
-    # Пытаемся получить initData из заголовка
-    auth_header = request.headers.get("authorization")
-    if auth_header and auth_header.startswith("tma "):
-        init_data = auth_header.split(" ", 1)[1]
-        validated_data = is_valid_tma_data(init_data)
-        if validated_data and 'user' in validated_data:
-            try:
-                user_info = json.loads(validated_data['user'])
-                return str(user_info['id'])
-            except (KeyError, json.JSONDecodeError):
-                pass
-                
+    user_id = authenticate_request(request)
+    if user_id is not None:
+        return str(user_id)
     return get_remote_address(request)
 
 # Переопределяем key_func у limiter после объявления функции
@@ -125,6 +214,7 @@ async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 async def get_current_user_id(
+    request: Request,
     authorization: Optional[str] = Header(None),
     # ИСПРАВЛЕНИЕ: Добавляем возможность получать авторизацию из query-параметра
     auth_query: Optional[str] = Query(None, alias="authorization")
@@ -135,23 +225,107 @@ async def get_current_user_id(
     if not auth_string or not auth_string.startswith("tma "):
         raise HTTPException(status_code=401, detail="Not authorized")
 
-    init_data = auth_string.split(" ", 1)[1]
-    validated_data = is_valid_tma_data(init_data)
-
-    if not validated_data or 'user' not in validated_data:
+    user_id = authenticate_request(request)
+    if user_id is None:
         raise HTTPException(status_code=403, detail="Invalid hash or user data")
+    return user_id
 
-    try:
-        user_info = json.loads(validated_data['user'])
-        return user_info['id']
-    except (KeyError, json.JSONDecodeError):
-        raise HTTPException(status_code=403, detail="Invalid user data format")
+
+# --- SSE HUB ---
+class FeedStreamHub:
+    """
+    Одна pattern-подписка user_feed:* на процесс API вместо Redis-подключения
+    на каждого зрителя. Пришедшие id постов раскладываются по asyncio.Queue
+    открытых SSE-подключений этого пользователя.
+    """
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self._queues: dict[int, set[asyncio.Queue]] = defaultdict(set)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def connect(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        self._queues[user_id].add(queue)
+        return queue
+
+    def disconnect(self, user_id: int, queue: asyncio.Queue):
+        queues = self._queues.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._queues[user_id]
+
+    def _dispatch(self, channel: str, data: str):
+        user_id = channel.rsplit(":", 1)[1]
+        if not user_id.isdigit():
+            return  # Посторонняя публикация в user_feed:* — не повод переподписываться
+        queues = self._queues.get(int(user_id))
+        if not queues:
+            return  # Пользователь не подключен к этому процессу
+        post_ids = [int(post_id) for post_id in data.split(",") if post_id.isdigit()]
+        for queue in queues:
+            try:
+                # У каждого подключения своя копия: генератор дополняет пачку на месте
+                queue.put_nowait(list(post_ids))
+            except asyncio.QueueFull:
+                logging.warning(f"SSE queue overflow for {channel}, dropping {len(post_ids)} posts")
+
+    async def _run(self):
+        while True:
+            redis_subscriber = aioredis.from_url(self.redis_url, decode_responses=True)
+            pubsub = redis_subscriber.pubsub()
+            try:
+                await pubsub.psubscribe("user_feed:*")
+                logging.info("SSE hub subscribed to user_feed:*")
+                async for message in pubsub.listen():
+                    if message.get("type") == "pmessage":
+                        self._dispatch(message["channel"], message.get("data") or "")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"SSE hub error, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await redis_subscriber.aclose()
+
+feed_hub = FeedStreamHub(REDIS_URL) if REDIS_URL else None
+
+
+# --- СТАТИСТИКА ---
+async def stats_reporter():
+    """Раз в минуту пишет статистику сжатия ответов в лог и в Redis (ключ api_stats:<API_INSTANCE_ID>)."""
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        try:
+            stats = {'compression': compression_stats.snapshot()}
+            logging.info(
+                f"📊 API {API_INSTANCE_ID}: ответов {stats['compression']['responses']}, "
+                f"сжато {stats['compression']['compressed']}, "
+                f"сэкономлено {stats['compression']['bytes_saved'] / 1024:.1f} КБ"
+            )
+            if api_redis:
+                await api_redis.set(f"api_stats:{API_INSTANCE_ID}", json.dumps(stats), ex=STATS_INTERVAL * 3)
+        except Exception as e:
+            logging.error(f"API stats publish failed: {e}")
 
 
 # --- STARTUP EVENT ---
 @app.on_event("startup")
 async def on_startup():
     await create_db()
+    if feed_hub:
+        feed_hub.start()
+    task = asyncio.create_task(stats_reporter())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
     if REDIS_URL:
         # ГЛАВНЫЙ ФИКС: Убираем `decode_responses=True`.
         # Библиотека fastapi-cache ожидает байты, а не строки, от Redis.
@@ -161,7 +335,7 @@ async def on_startup():
 
 
 # --- КЛЮЧ КЭШИРОВАНИЯ ---
-def feed_key_builder(
+async def feed_key_builder(
     func,
     namespace: str = "",
     *,
@@ -171,102 +345,188 @@ def feed_key_builder(
     kwargs={},
 ):
     """
-    Создает ключ кеша, который зависит от ПОЛНОЙ строки авторизации (initData).
-    Это гарантирует, что для разных пользователей (и даже разных сессий
-    одного пользователя) будут созданы уникальные ключи, предотвращая
-    пересечение кеша между аккаунтами.
+    Ключ кеша ленты: id пользователя (уже проверенный get_current_user_id),
+    версия его ленты и страница/курсор. Новая сессия Mini App попадает в тот же
+    кеш, а новые посты или смена подписок меняют версию — и ключ.
     """
-    if request is None:
-        # Fallback для случаев, когда request недоступен
+    user_id = kwargs.get("user_id")
+    if request is None or user_id is None or api_redis is None:
+        # Fallback: без пользователя или Redis ключ не переиспользуется
         return f"{namespace}:{time.time()}"
 
-    # Сначала пытаемся получить из заголовка, потом из query-параметра
-    auth_header = request.headers.get("authorization")
-    auth_query = request.query_params.get("authorization")
-    auth_string = auth_header or auth_query
+    page = kwargs.get("page", 1) # Получаем номер страницы из аргументов функции
+    cursor = kwargs.get("cursor") or ""
+    # Версия уже прочитана conditional_feed — ключ и ETag описывают одну и ту же ленту
+    version = getattr(request.state, "feed_version", None)
+    if version is None:
+        version = f"{await feed_cache.get_version(api_redis, user_id)}.{feed_cache.engagement_bucket()}"
 
-    # Если данных для авторизации нет, мы не можем создать пользовательский ключ
-    if not auth_string:
-        return f"{namespace}:{request.url.path}?{request.query_params}:{time.time()}"
+    return f"{namespace}:{request.url.path}:{user_id}:v{version}:page={page}:cursor={cursor}"
 
-    # Используем криптографический хеш от всей строки авторизации.
-    # Это создает уникальный и безопасный идентификатор для ключа кеша.
-    unique_auth_hash = hashlib.sha256(auth_string.encode('utf-8')).hexdigest()
 
-    page = kwargs.get("page", 1) # Получаем номер страницы из аргументов функции
+# --- УСЛОВНЫЕ ЗАПРОСЫ (ETag) ---
+def feed_etag(user_id: int, version: str, page: int, cursor: Optional[str]) -> str:
+    digest = hashlib.sha256(f"{user_id}:{version}:{page}:{cursor or ''}".encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
 
-    # Новый, безопасный ключ кеша
-    cache_key = f"{namespace}:{request.url.path}:{unique_auth_hash}:page={page}"
-    return cache_key
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    # Слабое сравнение: W/"x" и "x" считаются одним тегом
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+def conditional_feed(func):
+    """
+    ETag страницы ленты из feed_version:<user_id> — счетчика, который воркер
+    увеличивает при новых постах в каналах пользователя, а бот — при смене подписок, —
+    и интервала FEED_CACHE_TTL, за который обновляются просмотры и реакции.
+    Совпавший If-None-Match получает 304 до кеша, лимитера и Postgres:
+    обновление ленты без изменений стоит одного GET в Redis.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        request: Request = kwargs["request"]
+        user_id = kwargs.get("user_id")
+        if api_redis is None or user_id is None:
+            return await func(*args, **kwargs)
+        try:
+            version = f"{await feed_cache.get_version(api_redis, user_id)}.{feed_cache.engagement_bucket()}"
+        except Exception as e:
+            logging.error(f"Feed version read failed for {user_id}: {e}")
+            return await func(*args, **kwargs)
+        request.state.feed_version = version
+        etag = feed_etag(user_id, version, kwargs.get("page", 1), kwargs.get("cursor"))
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, **FEED_CACHE_HEADERS})
+        response = await func(*args, **kwargs)
+        if isinstance(response, Response) and response.status_code == 200:
+            # Если версия выросла, пока собирался ответ, тег окажется старше
+            # содержимого: следующий запрос просто получит 200, а не устаревший 304
+            response.headers["ETag"] = etag
+        return response
+    return wrapper
+
+
+# --- ЛЕНТЫ В REDIS ---
+async def rebuild_timeline(user_id: int):
+    try:
+        # Отметка ставится до чтения SQL: посты, сохраненные во время сборки, воркер допишет сам
+        if not await timelines.begin_rebuild(timeline_redis, user_id):
+            return  # Ленту уже строит другой запрос
+        async with session_maker() as session:
+            entries = await db.get_user_feed_entries(session, user_id, timelines.TIMELINE_SIZE)
+        await timelines.finish_rebuild(timeline_redis, user_id, entries)
+    except Exception as e:
+        logging.error(f"Timeline rebuild failed for {user_id}: {e}")
+
+async def read_timeline_page(session: AsyncSession, user_id: int, after) -> Optional[list[Post]]:
+    """Страница из ленты в Redis с догрузкой постов по id. None — промах, читать из SQL."""
+    if not timeline_redis:
+        return None
+    try:
+        post_ids = await timelines.read_page(timeline_redis, user_id, PAGE_SIZE, after)
+    except Exception as e:
+        logging.error(f"Timeline read failed for {user_id}: {e}")
+        return None
+    if post_ids is None:
+        if after is None:
+            # Ленты нет — строим в фоне, эту страницу отдаст SQL
+            task = asyncio.create_task(rebuild_timeline(user_id))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        return None
+    return await db.get_posts_by_ids(session, post_ids)
 
 
 # --- ЭНДПОИНТЫ ---
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    if feed_hub:
+        await feed_hub.stop()
+    for task in list(background_tasks):
+        task.cancel()
+
+
 @app.get("/api/feed/stream/")
-async def stream_user_posts(
-    user_id: int = Depends(get_current_user_id),
-    session: AsyncSession = Depends(get_db_session)
-):
-    if not REDIS_URL:
+async def stream_user_posts(user_id: int = Depends(get_current_user_id)):
+    if not feed_hub:
          raise HTTPException(status_code=503, detail="Stream service is not configured")
-    
-    redis_subscriber = aioredis.from_url(REDIS_URL, decode_responses=True)
 
     async def event_generator():
-        channel_name = f"user_feed:{user_id}"
-        pubsub = redis_subscriber.pubsub()
-        await pubsub.subscribe(channel_name)
-        
+        queue = feed_hub.connect(user_id)
         try:
             while True:
-                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=15)
-                if message and message.get("type") == "message":
-                    post_id_str = message.get("data")
-                    if post_id_str and post_id_str.isdigit():
-                        # Загружаем пост в новой сессии, чтобы избежать проблем с состоянием
-                        async with session_maker() as post_session:
-                           post = await post_session.get(Post, int(post_id_str), options=[selectinload(Post.channel)])
-                        if post:
-                            post_data = PostInFeed.model_validate(post).model_dump_json()
-                            yield f"data: {post_data}\n\n"
-                
-                yield f"event: heartbeat\ndata: \n\n"
-                await asyncio.sleep(15)
+                # Heartbeat уходит только в тишине и не задерживает доставку постов
+                try:
+                    post_ids = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield f"event: heartbeat\ndata: \n\n"
+                    continue
+                # Забираем всю накопившуюся пачку и грузим ее одним запросом
+                while not queue.empty():
+                    post_ids.extend(queue.get_nowait())
+                async with session_maker() as post_session:
+                    result = await post_session.execute(
+                        select(Post)
+                        .where(Post.id.in_(set(post_ids)))
+                        .options(selectinload(Post.channel))
+                        .order_by(Post.date)
+                    )
+                    posts = result.scalars().all()
+                for post in posts:
+                    post_data = schemas.dump_json(schemas.serialize_post(post)).decode()
+                    yield f"data: {post_data}\n\n"
 
         except asyncio.CancelledError:
             logging.info(f"Client {user_id} disconnected from stream.")
-            await pubsub.unsubscribe(channel_name)
-            await redis_subscriber.close()
             raise
+        finally:
+            feed_hub.disconnect(user_id, queue)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
-@app.get("/api/feed/", response_model=schemas.FeedResponse, dependencies=[Depends(DYNAMIC_CACHE_CONTROL)])
-@cache(expire=120, key_builder=feed_key_builder)
+@app.get("/api/feed/", response_model=schemas.FeedResponse)
+@conditional_feed
+@cache(expire=feed_cache.FEED_CACHE_TTL, key_builder=feed_key_builder, coder=FeedResponseCoder)
 @limiter.limit("30/minute")
 async def get_feed_for_user(
     request: Request,
     user_id: int = Depends(get_current_user_id),
     session: AsyncSession = Depends(get_db_session),
-    page: int = Query(1, ge=1)
+    page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None)
 ):
-    # Тело функции остается таким же, как в последней версии
-    offset = (page - 1) * PAGE_SIZE
-    feed = await db.get_user_feed(session=session, user_id=user_id, limit=PAGE_SIZE, offset=offset)
+    # Курсорный режим (и первая страница): стоимость не зависит от глубины.
+    # page > 1 без курсора — старый OFFSET-режим для совместимости.
+    if cursor or page == 1:
+        try:
+            after = db.decode_feed_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        feed = await read_timeline_page(session, user_id, after)
+        if feed is None:
+            feed = await db.get_user_feed_page(session=session, user_id=user_id, limit=PAGE_SIZE, cursor=cursor)
+    else:
+        offset = (page - 1) * PAGE_SIZE
+        feed = await db.get_user_feed(session=session, user_id=user_id, limit=PAGE_SIZE, offset=offset)
     has_posts = bool(feed)
 
-    if page == 1 and not has_posts:
+    if page == 1 and not cursor and not has_posts:
         subscriptions = await db.get_user_subscriptions(session=session, user_id=user_id)
         if subscriptions:
             if not await db.check_backfill_request_exists(session, user_id):
                  await db.create_backfill_request(session, user_id)
-            return {"posts": [], "status": "backfilling"}
+            return feed_response([], "backfilling")
         else:
-            return {"posts": [], "status": "empty"}
+            return feed_response([], "empty")
 
     status = "backfilling" if len(feed) < PAGE_SIZE else "ok"
-    return {"posts": feed, "status": status}
+    next_cursor = db.encode_feed_cursor(feed[-1]) if has_posts else None
+    # Схема FeedResponse остается в OpenAPI, но ответ собирается быстрым сериализатором
+    return feed_response(feed, status, next_cursor)
 
 
 @app.get("/health")
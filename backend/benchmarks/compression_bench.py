@@ -0,0 +1,44 @@
+"""
+Бенчмарк сжатия страницы ленты (та же страница, что в feed_serialization_bench).
+
+Запуск из каталога backend:
+    python -m benchmarks.compression_bench [--iterations 500]
+
+Печатает размер JSON до и после gzip/brotli и время сжатия одной страницы.
+brotli замеряется, только если установлен пакет Brotli.
+"""
+import argparse
+import time
+
+import compression
+from benchmarks.feed_serialization_bench import _make_page, fast_page
+
+
+def _bench(name: str, body: bytes, encoding: str, iterations: int):
+    compressed = compression.compress(body, encoding)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        compression.compress(body, encoding)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<10} {len(compressed):7d} байт ({len(compressed) / len(body):6.1%}), "
+        f"{elapsed / iterations * 1e6:8.1f} µs/страница"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    body = fast_page(_make_page())
+    print(f"Страница: {len(body)} байт JSON")
+    _bench("gzip", body, "gzip", args.iterations)
+    if compression.brotli is not None:
+        _bench("brotli", body, "br", args.iterations)
+    else:
+        print("brotli     пакет Brotli не установлен, пропущено")
+
+
+if __name__ == "__main__":
+    main()
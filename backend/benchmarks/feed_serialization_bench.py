@@ -0,0 +1,95 @@
+"""
+Бенчмарк сериализации страницы ленты (20 постов с медиа и реакциями).
+
+Запуск из каталога backend:
+    python -m benchmarks.feed_serialization_bench [--iterations 2000]
+
+Старый путь — то, что делал FastAPI с response_model=FeedResponse:
+валидация ORM-объектов pydantic-схемами и json.dumps; для SSE —
+PostInFeed.model_validate(...).model_dump_json() на каждый пост.
+Новый — schemas.serialize_post + orjson. Перед замером сверяет,
+что оба пути дают одинаковый JSON.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from database import schemas
+
+
+def _make_page(posts: int = 20) -> list:
+    channel = SimpleNamespace(
+        id=-1001234567890, title="Канал с медиа", username="media_channel",
+        avatar_url="https://cdn.example.com/avatars/-1001234567890.webp"
+    )
+    now = datetime.now(timezone.utc)
+    page = []
+    for i in range(posts):
+        media = [
+            {"type": "photo", "url": f"https://cdn.example.com/media/photo:{i}{j}.webp"}
+            for j in range(8)
+        ] + [{
+            "type": "video", "url": f"https://cdn.example.com/media/document:{i}.mp4",
+            "thumbnail_url": f"https://cdn.example.com/media/document:{i}_thumb.webp",
+        }]
+        reactions = [{"emoticon": e, "count": 100 + k} for k, e in enumerate("👍❤️🔥😁😢🎉")] + [
+            {"emoticon": None, "count": 7, "document_id": 5368324170671202286}
+        ]
+        page.append(SimpleNamespace(
+            message_id=10000 + i,
+            text="<p>" + "Текст поста с <b>разметкой</b> и ссылкой <a href=\"https://example.com\">example</a>. " * 6 + "</p>",
+            date=now - timedelta(minutes=i),
+            channel=channel,
+            media=media,
+            views=123456 + i,
+            reactions=reactions,
+            forwarded_from={"from_name": "Источник", "username": "source", "channel_id": 42} if i % 3 == 0 else None,
+        ))
+    return page
+
+
+def legacy_page(page: list) -> bytes:
+    model = schemas.FeedResponse.model_validate({"posts": [schemas.PostInFeed.model_validate(p) for p in page], "status": "ok"})
+    return json.dumps(model.model_dump(mode="json")).encode()
+
+
+def fast_page(page: list) -> bytes:
+    return schemas.dump_json({"posts": [schemas.serialize_post(p) for p in page], "status": "ok", "next_cursor": None})
+
+
+def legacy_sse(page: list) -> list[str]:
+    return [schemas.PostInFeed.model_validate(p).model_dump_json() for p in page]
+
+
+def fast_sse(page: list) -> list[str]:
+    return [schemas.dump_json(schemas.serialize_post(p)).decode() for p in page]
+
+
+def _bench(name: str, fn, page: list, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(page)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {elapsed / iterations * 1e6:9.1f} µs/страница")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    page = _make_page()
+    assert json.loads(legacy_page(page)) == json.loads(fast_page(page)), "ответы ленты расходятся"
+    assert [json.loads(s) for s in legacy_sse(page)] == [json.loads(s) for s in fast_sse(page)], "SSE расходится"
+    print(f"Страница: {len(fast_page(page))} байт JSON, 20 постов по 9 медиа и 7 реакций")
+
+    _bench("ответ ленты: pydantic + json", legacy_page, page, args.iterations)
+    _bench("ответ ленты: serialize_post + orjson", fast_page, page, args.iterations)
+    _bench("SSE: model_dump_json на пост", legacy_sse, page, args.iterations)
+    _bench("SSE: serialize_post + orjson", fast_sse, page, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Сжатие JSON-ответов API: brotli (пакет Brotli из requirements.txt), если клиент
+его принимает, иначе gzip. Без пакета Brotli остается только gzip.
+
+Ответы короче COMPRESSION_MIN_SIZE уходят как есть: на них заголовки и
+CPU дороже выигрыша. text/event-stream и другие несжимаемые типы проходят
+сразу, без задержки заголовков, — SSE получает каждое событие тут же.
+Сэкономленные байты копятся в CompressionStats и публикуются API вместе
+с остальной статистикой.
+"""
+import gzip
+import os
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Для динамических ответов качество 4–5 сжимает лучше gzip -6 и не медленнее
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    br или gzip из Accept-Encoding. Явная запись кодировки (в том числе q=0 —
+    запрет) важнее "*": звездочка относится только к неперечисленным кодировкам.
+    """
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    wildcard = qualities.get("*", 0.0)
+
+    def allowed(encoding: str) -> bool:
+        return qualities.get(encoding, wildcard) > 0
+
+    if brotli is not None and allowed("br"):
+        return "br"
+    if allowed("gzip"):
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    if content_type.startswith("text/event-stream"):
+        return False
+    return content_type.startswith(("application/json", "text/"))
+
+
+class CompressionStats:
+    """Счетчики сжатия процесса API: сколько ответов и байт до/после."""
+    def __init__(self):
+        self.responses = 0
+        self.compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.by_encoding: dict[str, int] = {}
+
+    def record(self, original: int, sent: int, encoding: Optional[str]):
+        self.responses += 1
+        self.bytes_in += original
+        self.bytes_out += sent
+        if encoding:
+            self.compressed += 1
+            self.by_encoding[encoding] = self.by_encoding.get(encoding, 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            'responses': self.responses,
+            'compressed': self.compressed,
+            'by_encoding': dict(self.by_encoding),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'bytes_saved': self.bytes_in - self.bytes_out,
+        }
+
+
+class CompressionMiddleware:
+    """
+    ASGI-middleware: ответ из одного тела сжимается целиком, все остальное
+    (SSE, многочастные потоки, уже сжатые ответы) проходит без изменений.
+    У сжимаемых типов (application/json, text/* кроме text/event-stream)
+    http.response.start придерживается до первого чанка тела: по нему решаем,
+    сжимать ли ответ. Несжимаемые типы, в том числе text/event-stream, и ответы
+    с Content-Encoding отдаются сразу.
+    """
+    def __init__(self, app, stats: CompressionStats, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.stats = stats
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        held_start: Optional[dict] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal held_start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type", "")):
+                    passthrough = True
+                    await send(message)
+                    return
+                held_start = message
+                return
+            if message["type"] != "http.response.body" or held_start is None:
+                await send(message)
+                return
+
+            start, held_start = held_start, None
+            passthrough = True  # Решение принимается по первому телу, дальше — как есть
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            if message.get("more_body") or len(body) < self.minimum_size:
+                if not message.get("more_body"):
+                    self.stats.record(len(body), len(body), None)
+                await send(start)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            if len(compressed) >= len(body):
+                self.stats.record(len(body), len(body), None)
+                await send(start)
+                await send(message)
+                return
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            self.stats.record(len(body), len(compressed), encoding)
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
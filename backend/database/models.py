@@ -30,6 +30,15 @@ class Channel(Base):
     username: Mapped[str] = mapped_column(String(150), nullable=True, unique=True)
     avatar_url: Mapped[str] = mapped_column(String(500), nullable=True)
 
+    # Курсор инкрементальной синхронизации: последний обработанный message_id
+    last_message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+
+    # Сохраненный peer канала: InputPeerChannel строится без resolve-запросов к Telegram
+    peer_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    access_hash: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    # access_hash выдается конкретному аккаунту: запоминаем, какому
+    peer_account: Mapped[str] = mapped_column(String(32), nullable=True)
+
     # Аудит
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -81,7 +90,8 @@ class Post(Base):
     # ТОЛЬКО ЭТО - никакого class Config:
     __table_args__ = (
         UniqueConstraint('channel_id', 'message_id', name='_channel_message_uc'),
-        Index('ix_posts_channel_date', 'channel_id', 'date'),
+        # Keyset-пагинация ленты: по каждому каналу идем по (date, id) от курсора
+        Index('ix_posts_channel_date_id', 'channel_id', 'date', 'id'),
         Index('ix_posts_grouped', 'grouped_id'),
         Index('ix_posts_views', 'views'),
     )
@@ -91,4 +101,14 @@ class BackfillRequest(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class MediaObject(Base):
+    __tablename__ = 'media_objects'
+
+    # Стабильный id медиа в Telegram: "photo:<id>" или "document:<id>"
+    file_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # Готовый элемент Post.media: type, url и (для видео) thumbnail_url
+    media: Mapped[dict] = mapped_column(JSONB)
+
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
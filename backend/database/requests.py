@@ -1,11 +1,13 @@
 from .models import User, Channel, Subscription, Post, BackfillRequest
 from sqlalchemy.dialects.postgresql import insert
 from .engine import session_maker
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, tuple_, true
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 from typing import Optional
+from datetime import datetime
+import base64
 
 
 async def add_subscription(
@@ -83,6 +85,80 @@ async def get_user_feed(session: AsyncSession, user_id: int, limit: int = 20, of
     feed_result = await session.execute(feed_query)
     return list(feed_result.scalars().all())
 
+def encode_feed_cursor(post: Post) -> str:
+    """Курсор — позиция последнего поста страницы в порядке ленты (date, id)."""
+    raw = f"{post.date.isoformat()}|{post.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_feed_cursor(cursor: str) -> tuple[datetime, int]:
+    """Обратное к encode_feed_cursor. На битом курсоре бросает ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date_str, post_id = raw.split("|")
+        return datetime.fromisoformat(date_str), int(post_id)
+    except Exception as e:
+        raise ValueError(f"Invalid feed cursor: {cursor}") from e
+
+def _feed_entries_query(user_id: int, limit: int, after: tuple[datetime, int] | None = None):
+    """(id, date) последних постов ленты старше after, через LATERAL по каналам подписки."""
+    subscriptions = (
+        select(Subscription.channel_id)
+        .where(Subscription.user_id == user_id)
+        .subquery()
+    )
+    conditions = [Post.channel_id == subscriptions.c.channel_id]
+    if after:
+        conditions.append(tuple_(Post.date, Post.id) < after)
+    per_channel = (
+        select(Post.id, Post.date)
+        .where(*conditions)
+        .order_by(Post.date.desc(), Post.id.desc())
+        .limit(limit)
+        .lateral()
+    )
+    return (
+        select(per_channel.c.id, per_channel.c.date)
+        .select_from(subscriptions.join(per_channel, true()))
+        .order_by(per_channel.c.date.desc(), per_channel.c.id.desc())
+        .limit(limit)
+    )
+
+async def get_user_feed_entries(session: AsyncSession, user_id: int, limit: int) -> list[tuple[int, datetime]]:
+    """Последние limit постов ленты как (id, date) — для построения ленты в Redis."""
+    result = await session.execute(_feed_entries_query(user_id, limit))
+    return [(post_id, date) for post_id, date in result.all()]
+
+async def get_posts_by_ids(session: AsyncSession, post_ids: list[int]) -> list[Post]:
+    """Мульти-гет постов по первичному ключу в порядке post_ids."""
+    if not post_ids:
+        return []
+    result = await session.execute(
+        select(Post).where(Post.id.in_(post_ids)).options(selectinload(Post.channel))
+    )
+    posts = {post.id: post for post in result.scalars().all()}
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+async def get_user_feed_page(
+    session: AsyncSession,
+    user_id: int,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> list[Post]:
+    """
+    Keyset-пагинация ленты: посты строго старше курсора в порядке (date, id).
+    Для каждого канала подписки берется не больше limit постов по индексу
+    ix_posts_channel_date_id (LATERAL), поэтому глубокая страница стоит как первая.
+    """
+    page_ids = _feed_entries_query(user_id, limit, decode_feed_cursor(cursor) if cursor else None).subquery()
+    feed_query = (
+        select(Post)
+        .join(page_ids, Post.id == page_ids.c.id)
+        .options(selectinload(Post.channel))
+        .order_by(Post.date.desc(), Post.id.desc())
+    )
+    feed_result = await session.execute(feed_query)
+    return list(feed_result.scalars().all())
+
 async def get_user_subscriptions(session: AsyncSession, user_id: int) -> list[Channel]:
     """
     Возвращает список объектов Channel, на которые подписан пользователь.
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, ConfigDict, validator, HttpUrl
 from datetime import datetime
 from typing import List, Optional
+import orjson
 
 
 class ReactionItem(BaseModel):
@@ -52,6 +53,8 @@ class PostInFeed(BaseModel):
 class FeedResponse(BaseModel):
     posts: List[PostInFeed]
     status: str
+    # Непрозрачный курсор следующей страницы: передается обратно в /api/feed/?cursor=
+    next_cursor: Optional[str] = None
     
     @validator('status')
     def validate_status(cls, v):
@@ -61,6 +64,40 @@ class FeedResponse(BaseModel):
         return v
 
 
+# --- Быстрая сериализация ленты ---
+# Повторяет вывод PostInFeed.model_dump(mode="json") без pydantic-валидации.
+# При изменении схем выше — обновить и эти функции (сверяет benchmarks.feed_serialization_bench).
+MEDIA_FIELDS = ('type', 'url', 'thumbnail_url')
+REACTION_FIELDS = ('emoticon', 'count', 'document_id')
+
+
+def serialize_post(post) -> dict:
+    channel = post.channel
+    return {
+        'message_id': post.message_id,
+        'text': post.text,
+        'date': post.date,
+        'channel': {
+            'id': channel.id,
+            'title': channel.title,
+            'username': channel.username,
+            'avatar_url': channel.avatar_url,
+        },
+        'media': [{key: item.get(key) for key in MEDIA_FIELDS} for item in post.media] if post.media is not None else None,
+        'views': post.views,
+        'reactions': (
+            [{key: item.get(key) for key in REACTION_FIELDS} for item in post.reactions]
+            if post.reactions is not None else None
+        ),
+        'forwarded_from': post.forwarded_from,
+    }
+
+
+def dump_json(content) -> bytes:
+    # OPT_UTC_Z: даты в UTC как "...Z", как у pydantic
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
 # Дополнительные схемы для других endpoints
 class ChannelInfo(BaseModel):
     model_config = ConfigDict(from_attributes=True)
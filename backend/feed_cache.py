@@ -0,0 +1,39 @@
+"""
+Версии лент пользователей для кеша /api/feed/.
+
+Ключ кеша страницы включает feed_version:<user_id>. Воркер увеличивает версию,
+когда в каналах пользователя появляются посты, бот — при подписке и отписке.
+Старые записи кеша после этого просто перестают читаться и истекают по TTL,
+поэтому сам TTL можно держать длинным.
+
+Просмотры и реакции обновляются без смены версии, поэтому ключ и ETag
+включают еще и номер интервала FEED_CACHE_TTL: свежесть счетчиков
+ограничена этим интервалом, как и раньше.
+"""
+import os
+import time
+
+FEED_CACHE_TTL = int(os.getenv("FEED_CACHE_TTL", "900"))
+BUMP_BATCH = 1000
+
+
+def engagement_bucket() -> int:
+    return int(time.time() // FEED_CACHE_TTL)
+
+
+def version_key(user_id: int) -> str:
+    return f"feed_version:{user_id}"
+
+
+async def get_version(redis, user_id: int) -> str:
+    version = await redis.get(version_key(user_id))
+    return version.decode() if isinstance(version, bytes) else (version or "0")
+
+
+async def bump_versions(redis, user_ids: list[int]):
+    """INCR версий пачками по BUMP_BATCH через pipeline."""
+    for i in range(0, len(user_ids), BUMP_BATCH):
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids[i:i + BUMP_BATCH]:
+                pipe.incr(version_key(user_id))
+            await pipe.execute()
@@ -1,12 +1,20 @@
+from typing import Optional
+import redis.asyncio as aioredis
 from aiogram import Router, F, types
 from sqlalchemy.ext.asyncio import AsyncSession
 from database.requests import delete_subscription # Импортируем функцию удаления
+import timelines
+import feed_cache
 
 router = Router()
 
 # Этот хендлер будет срабатывать на callback-и, которые начинаются с "unsub:"
 @router.callback_query(F.data.startswith("unsub:"))
-async def process_unsubscription(callback: types.CallbackQuery, session: AsyncSession):
+async def process_unsubscription(
+    callback: types.CallbackQuery,
+    session: AsyncSession,
+    redis_client: Optional[aioredis.Redis] = None
+):
     # Убеждаемся, что callback пришел от реального пользователя
     if not callback.from_user:
         await callback.answer("Не могу определить пользователя.", show_alert=True)
@@ -24,6 +32,12 @@ async def process_unsubscription(callback: types.CallbackQuery, session: AsyncSe
     # Вызываем функцию удаления из БД
     success = await delete_subscription(session, callback.from_user.id, channel_id)
 
+    if success and redis_client:
+        # Посты отписанного канала не должны остаться ни в кеше, ни в ленте
+        await feed_cache.bump_versions(redis_client, [callback.from_user.id])
+        if timelines.TIMELINE_STORE:
+            await timelines.invalidate(redis_client, callback.from_user.id)
+
     if success:
         # Если удачно, редактируем исходное сообщение, чтобы убрать кнопки
         if isinstance(callback.message, types.Message):
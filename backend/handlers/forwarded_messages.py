@@ -7,10 +7,13 @@ from collections import defaultdict
 from aiogram import Router, types, F
 from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio
+import uuid
 
 # --- ДОБАВЛЕНО: Импортируем клиент Telethon для проверки ---
-from worker import client
+from worker import client, NEW_CHANNEL_STREAM
 from database.requests import add_subscription
+import timelines
+import feed_cache
 
 router = Router()
 user_locks = defaultdict(lambda: asyncio.Lock())
@@ -71,6 +74,12 @@ async def handle_forwarded_message(message: types.Message, session: AsyncSession
     
     await message.answer(response_msg)
 
+    if redis_client:
+        # Набор каналов изменился: кеш ленты устарел, лента пересоберется при следующем открытии
+        await feed_cache.bump_versions(redis_client, [message.from_user.id])
+        if timelines.TIMELINE_STORE:
+            await timelines.invalidate(redis_client, message.from_user.id)
+
     # Отправка задачи в Redis (остается без изменений)
     if new_channel and redis_client:
         try:
@@ -83,7 +92,10 @@ async def handle_forwarded_message(message: types.Message, session: AsyncSession
             logging.info(f"📤 Отправляю задачу в Redis: {task}")
             
             task_json: str = json.dumps(task)
-            await redis_client.lpush("new_channel_tasks", task_json)
+            # Ключ идемпотентности: повторная доставка той же задачи воркером не выполняется,
+            # а повторное добавление канала — это новая задача
+            job_id = uuid.uuid4().hex
+            await redis_client.xadd(NEW_CHANNEL_STREAM, {"job_id": job_id, "payload": task_json, "attempt": 0})
             
             logging.info(f"✅ Задача успешно отправлена в Redis для канала {new_channel.title}")
             
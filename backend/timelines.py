@@ -0,0 +1,141 @@
+"""
+Предрассчитанные ленты пользователей в Redis (fan-out-on-write).
+
+timeline:<user_id> — ZSET с id постов ленты, score — дата поста (unix-время),
+не больше TIMELINE_SIZE последних постов. Служебный элемент "0" отмечает
+состояние ленты: score 0 — лента строится, 1 — готова (в том числе пустая).
+Воркер дописывает новые посты только в ленты с этой отметкой, в том числе в те,
+что еще строятся, — так пост, сохраненный между чтением SQL и записью ленты,
+не теряется. Отсутствующая или недостроенная лента — промах: API отдает страницу
+из SQL и строит ленту заново. Подписка/отписка просто удаляет ленту.
+Чтение и дописывание продлевают TTL готовой ленты.
+"""
+import os
+from datetime import datetime
+
+TIMELINE_STORE = os.getenv("TIMELINE_STORE", "false").lower() in ("1", "true", "yes")
+TIMELINE_SIZE = int(os.getenv("TIMELINE_SIZE", "500"))
+TIMELINE_TTL = 24 * 3600  # Неактивные ленты не занимают память и периодически пересобираются
+BUILD_TTL = 120  # Недостроенная лента (API упал посреди сборки) исчезнет сама
+PUSH_BATCH = 1000
+STATE_MEMBER = "0"  # id постов начинаются с 1
+BUILDING, READY = 0, 1  # Меньше любой даты поста: отметка всегда на ранге 0
+
+# Дописать посты в ленту с отметкой (готовую или строящуюся), обрезать до TIMELINE_SIZE
+# (ранг 0 — отметка — не трогаем) и продлить TTL готовой ленты
+_PUSH_SCRIPT = f"""
+    local state = redis.call('ZSCORE', KEYS[1], '{STATE_MEMBER}')
+    if not state then
+        return 0
+    end
+    for i = 3, #ARGV, 2 do
+        redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 1, -(tonumber(ARGV[1]) + 1))
+    if tonumber(state) == {READY} then
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return 1
+"""
+
+# Начать сборку: отметка BUILDING, если ленты с отметкой еще нет. 0 — ее уже строят или она готова
+_BEGIN_SCRIPT = f"""
+    if redis.call('ZADD', KEYS[1], 'NX', {BUILDING}, '{STATE_MEMBER}') == 0 then
+        return 0
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    return 1
+"""
+
+# Завершить сборку: слить снимок из SQL с уже дописанными постами (ZADD, без DEL).
+# Если ленту за это время удалили (смена подписок), снимок устарел — не пишем
+_FINISH_SCRIPT = f"""
+    local state = redis.call('ZSCORE', KEYS[1], '{STATE_MEMBER}')
+    if not state or tonumber(state) ~= {BUILDING} then
+        return 0
+    end
+    for i = 3, #ARGV, 2 do
+        redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('ZADD', KEYS[1], {READY}, '{STATE_MEMBER}')
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 1, -(tonumber(ARGV[1]) + 1))
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+"""
+
+# Страница готовой ленты: отметка, размер и посты с score <= ARGV[1]; TTL продлевается.
+# Посты с той же секундой, что и курсор, отсекаются в Python по id — берем с запасом
+_READ_SCRIPT = f"""
+    local state = redis.call('ZSCORE', KEYS[1], '{STATE_MEMBER}')
+    if not state or tonumber(state) ~= {READY} then
+        return false
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    local members = redis.call('ZREVRANGEBYSCORE', KEYS[1], ARGV[1], '({READY}', 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+    return {{redis.call('ZCARD', KEYS[1]) - 1, members}}
+"""
+
+
+def timeline_key(user_id: int) -> str:
+    return f"timeline:{user_id}"
+
+
+def _entry_args(entries: list[tuple[int, datetime]]) -> list:
+    args = []
+    for post_id, date in entries:
+        args.extend((date.timestamp(), post_id))
+    return args
+
+
+async def push_posts(redis, user_ids: list[int], posts: list[tuple[int, datetime]]):
+    """Дописывает посты (id, date) в ленты подписчиков пачками по PUSH_BATCH через pipeline."""
+    script = redis.register_script(_PUSH_SCRIPT)
+    args = [TIMELINE_SIZE, TIMELINE_TTL, *_entry_args(posts)]
+    for i in range(0, len(user_ids), PUSH_BATCH):
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids[i:i + PUSH_BATCH]:
+                await script(keys=[timeline_key(user_id)], args=args, client=pipe)
+            await pipe.execute()
+
+
+async def begin_rebuild(redis, user_id: int) -> bool:
+    """
+    Отмечает ленту как строящуюся до чтения SQL: с этого момента воркер дописывает
+    в нее новые посты. False — ленту уже строит другой запрос или она готова.
+    """
+    script = redis.register_script(_BEGIN_SCRIPT)
+    return bool(await script(keys=[timeline_key(user_id)], args=[BUILD_TTL]))
+
+
+async def finish_rebuild(redis, user_id: int, entries: list[tuple[int, datetime]]) -> bool:
+    """Сливает последние посты из SQL (id, date) с лентой и отмечает ее готовой, даже пустую."""
+    script = redis.register_script(_FINISH_SCRIPT)
+    args = [TIMELINE_SIZE, TIMELINE_TTL, *_entry_args(entries)]
+    return bool(await script(keys=[timeline_key(user_id)], args=args))
+
+
+async def invalidate(redis, user_id: int):
+    """Набор каналов пользователя изменился — лента пересоберется при следующем чтении."""
+    await redis.delete(timeline_key(user_id))
+
+
+async def read_page(redis, user_id: int, limit: int, after: tuple[datetime, int] | None = None) -> list[int] | None:
+    """
+    id постов страницы ленты строго старше after = (date, id), новые сначала.
+    None — промах: ленты нет, она строится или страница уходит за ее обрезанный хвост.
+    """
+    script = redis.register_script(_READ_SCRIPT)
+    max_score = after[0].timestamp() if after else "+inf"
+    result = await script(keys=[timeline_key(user_id)], args=[max_score, limit * 2, TIMELINE_TTL])
+    if not result:
+        return None
+    size, members = result
+    entries = sorted(
+        ((float(members[i + 1]), int(members[i])) for i in range(0, len(members), 2)), reverse=True
+    )
+    if after:
+        cursor = (after[0].timestamp(), after[1])
+        entries = [entry for entry in entries if entry < cursor]
+    if len(entries) < limit and size >= TIMELINE_SIZE:
+        return None  # Дальше обрезанного хвоста ленты — только SQL
+    return [post_id for _, post_id in entries[:limit]]
@@ -0,0 +1,21 @@
+"""
+Перекодирование изображений в WebP.
+
+Функции выполняются в процессах ProcessPoolExecutor воркера, поэтому модуль
+не держит глобального состояния: на вход и выход — только bytes.
+"""
+import io
+from PIL import Image
+
+
+def to_webp(data: bytes, quality: int = 80) -> bytes:
+    with Image.open(io.BytesIO(data)) as im:
+        im = im.convert("RGB")
+        output = io.BytesIO()
+        im.save(output, format="WEBP", quality=quality)
+    return output.getvalue()
+
+
+def warm_up() -> bool:
+    """Пустая задача, чтобы поднять процессы пула заранее."""
+    return True
@@ -7,22 +7,37 @@ import io
 import time
 import bleach
 import signal
+import heapq
+import math
 import json
+import functools
+import hashlib
+import bisect
+import contextlib
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+import multiprocessing
 import redis.asyncio as aioredis
 from typing import Dict, Any
 from dotenv import load_dotenv
-from telethon import TelegramClient, types
-from telethon.errors import ChannelPrivateError, FloodWaitError
-from sqlalchemy import select, distinct, update
+from telethon import TelegramClient, types, events, functions, utils
+from telethon.errors import ChannelPrivateError, FloodWaitError, ChannelInvalidError, PeerIdInvalidError
+from sqlalchemy import select, distinct, update, delete, func, or_, and_, values, column, cast, BigInteger, Text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import insert
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from botocore.config import Config as BotoConfig
 from os.path import splitext
 
 from database.engine import session_maker, create_db
-from database.models import Channel, Post, BackfillRequest, Subscription
+from database.models import Channel, Post, BackfillRequest, Subscription, MediaObject
+import transcoder
+import timelines
+import feed_cache
 from telethon.sessions import StringSession
-from PIL import Image
 from html import escape
 from markdown_it import MarkdownIt
 
@@ -39,15 +54,18 @@ try:
     API_ID_STR = os.getenv("API_ID")
     API_HASH = os.getenv("API_HASH") 
     SESSION_STRING = os.getenv("TELETHON_SESSION")
+    # Пул аккаунтов: несколько сессий через запятую; каналы шардируются между ними
+    SESSION_STRINGS = [s.strip() for s in (os.getenv("TELETHON_SESSIONS") or SESSION_STRING or "").split(",") if s.strip()]
     REDIS_URL = os.getenv("REDIS_URL") or os.getenv("REDIS_PUBLIC_URL")
     S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
     S3_REGION = os.getenv("S3_REGION")
     AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
     AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # Для локального S3 (minio/moto)
     
     print(f"  API_ID: {'✅' if API_ID_STR else '❌'}")
     print(f"  API_HASH: {'✅' if API_HASH else '❌'}")
-    print(f"  SESSION_STRING: {'✅' if SESSION_STRING else '❌'}")
+    print(f"  SESSION_STRING: {'✅' if SESSION_STRINGS else '❌'} (аккаунтов: {len(SESSION_STRINGS)})")
     print(f"  REDIS_URL: {'✅' if REDIS_URL else '❌'}")
     print(f"  S3_BUCKET_NAME: {'✅' if S3_BUCKET_NAME else '❌'}")
     
@@ -72,6 +90,69 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # ✅ КОНСТАНТЫ
 POST_LIMIT, SLEEP_TIME = 20, 300
+# Максимум сообщений за один инкрементальный проход; остаток догоняется в следующем цикле
+CATCHUP_LIMIT = int(os.getenv("CATCHUP_LIMIT", "200"))
+# Адаптивный планировщик: границы интервала опроса канала (сек) и число параллельных опросов
+MIN_POLL_INTERVAL = int(os.getenv("MIN_POLL_INTERVAL", "10"))
+MAX_POLL_INTERVAL = int(os.getenv("MAX_POLL_INTERVAL", "3600"))
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "15"))
+CHANNEL_REFRESH_INTERVAL, STATS_INTERVAL = 60, 60
+# Загрузки в S3 идут в отдельном пуле потоков, чтобы не блокировать event loop
+S3_UPLOAD_THREADS = int(os.getenv("S3_UPLOAD_THREADS", "10"))
+# Перекодирование изображений — в отдельных процессах, чтобы не занимать event loop
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "2"))
+# Видео/аудио крупнее порога переливаются в S3 потоково (multipart), частями по S3_PART_SIZE
+MAX_MEDIA_SIZE = int(os.getenv("MAX_MEDIA_SIZE_MB", "60")) * 1024 * 1024
+STREAM_UPLOAD_THRESHOLD = int(os.getenv("STREAM_UPLOAD_THRESHOLD_MB", "8")) * 1024 * 1024
+S3_PART_SIZE = max(int(os.getenv("S3_PART_SIZE_MB", "8")), 5) * 1024 * 1024  # Минимум S3 — 5 МБ
+# Обновление просмотров/реакций: (возраст поста до, обновлять не чаще чем раз в)
+ENGAGEMENT_TIERS = [
+    (timedelta(hours=1), timedelta(minutes=5)),
+    (timedelta(hours=6), timedelta(minutes=30)),
+    (timedelta(hours=48), timedelta(hours=2)),
+]
+ENGAGEMENT_TICK = int(os.getenv("ENGAGEMENT_TICK", "300"))
+FORWARD_CACHE_TTL, FORWARD_NEGATIVE_TTL = 6 * 3600, 600
+# Лимиты запросов к Telegram по классам методов: (запросов в секунду, размер пачки)
+TELEGRAM_RATE_LIMITS = {
+    'history': (5.0, 10),
+    'resolve': (0.2, 3),
+    'download': (10.0, 20),
+    'engagement': (2.0, 5),
+    'join': (0.05, 1),
+    'other': (1.0, 3),
+}
+FLOOD_MAX_RETRIES = 3
+# FloodWait на этих методах приостанавливает только свой класс: долгий запрет
+# на вступление в каналы не должен останавливать опрос
+ISOLATED_FLOOD_CLASSES = {'join'}
+UNAVAILABLE_FORWARD_SOURCE = {"from_name": "Недоступный источник", "username": None, "channel_id": None}
+ENGAGEMENT_BATCH = 100  # Максимум id в одном GetMessagesViews/GetMessagesReactions
+# Push-режим: аккаунт вступает в каналы и получает новые посты через update-события
+PUSH_INGESTION = os.getenv("PUSH_INGESTION", "false").lower() in ("1", "true", "yes")
+PUSH_JOIN_BATCH = int(os.getenv("PUSH_JOIN_BATCH", "5"))
+# Несколько реплик воркера делят каналы через истекающие лизы в Redis.
+# Каналы умершей реплики подхватываются не позже чем через LEASE_TTL + LEASE_RENEW_INTERVAL.
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+LEASE_TTL = int(os.getenv("LEASE_TTL", "30"))
+LEASE_RENEW_INTERVAL = max(LEASE_TTL // 3, 1)
+# Дозагрузка истории для пользователей с пустой лентой (заявки backfill_requests)
+BACKFILL_DEPTH = int(os.getenv("BACKFILL_DEPTH", "100"))  # Сообщений вглубь на канал
+BACKFILL_PAGE = 50
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "3"))
+BACKFILL_POLL_INTERVAL, BACKFILL_LEASE_TTL = 5, 600
+BACKFILL_REQUEST_MAX_AGE = timedelta(days=1)  # Заявку, которая так и не удалась, в итоге удаляем
+# Задачи бота на подключение каналов: Redis Stream с consumer group, повторы и dead-letter
+NEW_CHANNEL_STREAM, NEW_CHANNEL_GROUP = "new_channel_jobs", "channel_workers"
+NEW_CHANNEL_DELAYED, NEW_CHANNEL_DEAD = "new_channel_jobs:delayed", "new_channel_jobs:dead"
+JOB_MAX_ATTEMPTS, JOB_BACKOFF_BASE = 5, 10  # Задержки повторов: 10, 20, 40, 80 сек
+JOB_CLAIM_IDLE = 5 * 60 * 1000  # Через сколько мс задачу упавшей реплики забирает другая
+JOB_RECLAIM_INTERVAL, JOB_DONE_TTL = 30, 24 * 3600
+# Взятые в работу записи регулярно «продлеваются» (XCLAIM JUSTID сбрасывает idle),
+# иначе подключение, ждущее паузу FloodWait дольше JOB_CLAIM_IDLE, забрали бы повторно
+JOB_HEARTBEAT_INTERVAL = 60
+ONBOARDING_CONCURRENCY = int(os.getenv("ONBOARDING_CONCURRENCY", "8"))
+FANOUT_BATCH = 1000  # PUBLISH в user_feed:<user_id> за один pipeline
 shutdown_event = asyncio.Event()
 
 # ✅ ПАРСЕРЫ И КЛИЕНТЫ
@@ -121,6 +202,11 @@ class ThreadSafeEntityCache:
                 logging.error(f"Ошибка получения entity для {cache_key}: {e}")
                 return None
                 
+    async def invalidate(self, cache_key: str):
+        async with self._main_lock:
+            self._cache.pop(cache_key, None)
+            self._access_times.pop(cache_key, None)
+
     async def _cleanup_if_needed(self):
         async with self._main_lock:
             if len(self._cache) >= self._max_size:
@@ -130,6 +216,165 @@ class ThreadSafeEntityCache:
                     self._access_times.pop(key, None)
                     self._locks.pop(key, None)
 
+class TTLCache:
+    """
+    Кэш с истечением записей и негативным кэшированием: неудачный результат (None
+    или исключение) тоже запоминается, но на negative_ttl. Параллельные запросы
+    одного ключа объединяются в один вызов fetch_func.
+    """
+    def __init__(self, ttl: float, negative_ttl: float, max_size: int = 5000):
+        self._ttl, self._negative_ttl, self._max_size = ttl, negative_ttl, max_size
+        self._data: Dict[Any, tuple[float, Any]] = {}
+        self._inflight: Dict[Any, asyncio.Future] = {}
+
+    async def get_or_fetch(self, key, fetch_func):
+        entry = self._data.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        value = None
+        try:
+            value = await fetch_func()
+        except Exception as e:
+            logging.warning(f"Не удалось получить {key}: {e}")
+        finally:
+            self._inflight.pop(key, None)
+            future.set_result(value)
+        self._store(key, value, self._ttl if value is not None else self._negative_ttl)
+        return value
+
+    def _store(self, key, value, ttl: float):
+        if len(self._data) >= self._max_size:
+            now = time.monotonic()
+            for stale_key in [k for k, (expires, _) in self._data.items() if expires <= now]:
+                del self._data[stale_key]
+            # Если просроченных нет — выкидываем самые старые записи
+            for old_key in list(self._data)[:max(len(self._data) - self._max_size + 1, 0)]:
+                del self._data[old_key]
+        self._data[key] = (time.monotonic() + ttl, value)
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate, self.capacity = rate, capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def reserve(self, cost: float = 1) -> float:
+        """Списывает токены (баланс может уйти в минус — это очередь) и возвращает, сколько ждать."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= cost
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class TelegramRateGovernor:
+    """
+    Единая точка для всех запросов к Telegram: token bucket на каждый класс методов
+    и глобальная пауза при FloodWaitError, после которой запрос повторяется.
+    """
+    def __init__(self, limits: Dict[str, tuple[float, int]]):
+        self._buckets = {name: TokenBucket(rate, capacity) for name, (rate, capacity) in limits.items()}
+        self._paused_until = 0.0
+        self._class_paused_until: Dict[str, float] = {}
+        self.throttled_seconds = 0.0
+        self.flood_waits = 0
+
+    async def _sleep(self, seconds: float):
+        self.throttled_seconds += seconds
+        await asyncio.sleep(seconds)
+
+    def paused_for(self, method_class: str) -> float:
+        until = max(self._paused_until, self._class_paused_until.get(method_class, 0.0))
+        return max(until - time.monotonic(), 0.0)
+
+    async def acquire(self, method_class: str, cost: float = 1):
+        while (pause := self.paused_for(method_class)) > 0:
+            await self._sleep(pause)
+        delay = self._buckets.get(method_class, self._buckets['other']).reserve(cost)
+        if delay:
+            await self._sleep(delay)
+
+    async def call(self, method_class: str, func, *args, cost: float = 1, retries: int = FLOOD_MAX_RETRIES, **kwargs):
+        for attempt in range(retries + 1):
+            await self.acquire(method_class, cost)
+            try:
+                return await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                until = time.monotonic() + e.seconds + 1
+                if method_class in ISOLATED_FLOOD_CLASSES:
+                    self._class_paused_until[method_class] = max(self._class_paused_until.get(method_class, 0.0), until)
+                    logging.warning(f"⏳ FloodWait {e.seconds}с на {method_class}: на паузе только {method_class}")
+                else:
+                    self._paused_until = max(self._paused_until, until)
+                    logging.warning(f"⏳ FloodWait {e.seconds}с на {method_class}: все запросы к Telegram на паузе")
+                if attempt == retries:
+                    raise
+
+    def snapshot(self) -> dict:
+        return {
+            'throttled_seconds': round(self.throttled_seconds, 1),
+            'flood_waits': self.flood_waits,
+            'paused_for': round(max(self._paused_until - time.monotonic(), 0.0), 1),
+        }
+
+class ConsistentHashRing:
+    """Кольцо консистентного хеширования: добавление аккаунта переносит лишь часть каналов."""
+    def __init__(self, nodes: list[str], replicas: int = 100):
+        self._ring = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self._hashes = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def get(self, item) -> str | None:
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(str(item))) % len(self._ring)
+        return self._ring[index][1]
+
+class TelegramAccount:
+    """Один Telethon-аккаунт со своими лимитами и кэшами: access_hash у каждого аккаунта свой."""
+    def __init__(self, key: str, telethon_client: TelegramClient):
+        self.key = key
+        self.client = telethon_client
+        self.governor = TelegramRateGovernor(TELEGRAM_RATE_LIMITS)
+        self.entity_cache = ThreadSafeEntityCache()
+        self.forward_cache = TTLCache(ttl=FORWARD_CACHE_TTL, negative_ttl=FORWARD_NEGATIVE_TTL)
+        self.joined_channels: set[int] = set()
+        self.joined_channels_loaded = False
+        self.was_connected = True
+
+    async def call(self, method_class: str, func, *args, **kwargs):
+        return await self.governor.call(method_class, func, *args, **kwargs)
+
+class TelegramAccountPool:
+    def __init__(self, accounts: list[TelegramAccount]):
+        self._accounts = {account.key: account for account in accounts}
+        self._ring = ConsistentHashRing(list(self._accounts))
+
+    def __iter__(self):
+        return iter(self._accounts.values())
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def for_channel(self, channel_id: int) -> TelegramAccount | None:
+        key = self._ring.get(channel_id)
+        return self._accounts[key] if key else None
+
+    @property
+    def default(self) -> TelegramAccount | None:
+        """Первая сессия TELETHON_SESSIONS — она же единственная до появления пула."""
+        return next(iter(self._accounts.values()), None)
+
 class WorkerStats:
     def __init__(self):
         self.start_time = time.time()
@@ -157,6 +402,136 @@ class WorkerStats:
                 'errors': self.errors
             }
 
+class ChannelPollState:
+    def __init__(self, channel: Channel, subscribers: int):
+        self.channel = channel
+        self.subscribers = subscribers
+        self.rate = 0.0  # Сглаженная частота публикаций, постов/сек
+        self.rate_known = False
+        self.interval = float(SLEEP_TIME)
+        self.next_due = time.time()
+        self.last_polled: float | None = None
+        self.last_lag = 0.0
+        self.in_flight = False
+
+class AdaptiveChannelScheduler:
+    """
+    Очередь с приоритетом по времени следующего опроса. Интервал каждого канала
+    подстраивается под его частоту публикаций и число подписчиков: активные
+    каналы опрашиваются раз в несколько секунд, "мертвые" — раз в час.
+    """
+    RATE_ALPHA = 0.3  # Вес последнего наблюдения в EWMA
+
+    def __init__(self):
+        self._states: Dict[int, ChannelPollState] = {}
+        self._heap: list[tuple[float, int]] = []
+        self._wakeup = asyncio.Event()
+
+    def _push(self, state: ChannelPollState):
+        heapq.heappush(self._heap, (state.next_due, state.channel.id))
+        if self._heap[0][1] == state.channel.id:
+            self._wakeup.set()
+
+    def sync_channels(self, channels: list[tuple[Channel, int]]):
+        seen = set()
+        for channel, subscribers in channels:
+            seen.add(channel.id)
+            state = self._states.get(channel.id)
+            if state is None:
+                # Новый канал опрашиваем сразу
+                state = ChannelPollState(channel, subscribers)
+                self._states[channel.id] = state
+                self._push(state)
+            else:
+                state.subscribers = subscribers
+                state.channel.title = channel.title
+                state.channel.username = channel.username
+        for channel_id in set(self._states) - seen:
+            # Записи в куче для удаленных каналов отбросятся лениво
+            self._states.pop(channel_id, None)
+
+    def compute_interval(self, state: ChannelPollState) -> float:
+        # В среднем ~1 новый пост на опрос; популярные каналы опрашиваем чаще
+        base = 1 / state.rate if state.rate > 0 else MAX_POLL_INTERVAL
+        interval = base / (1 + math.log10(max(state.subscribers, 1)))
+        return min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+    async def next_due(self) -> ChannelPollState | None:
+        """Ждет канал, срок опроса которого наступил. None — при остановке воркера."""
+        while not shutdown_event.is_set():
+            if self._heap:
+                due, channel_id = self._heap[0]
+                state = self._states.get(channel_id)
+                if state is None or state.in_flight or state.next_due != due:
+                    heapq.heappop(self._heap)
+                    continue
+                now = time.time()
+                if due <= now:
+                    heapq.heappop(self._heap)
+                    state.in_flight = True
+                    state.last_lag = now - due
+                    return state
+                timeout = min(due - now, 1.0)
+            else:
+                timeout = 1.0
+            self._wakeup.clear()
+            try: await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError: pass
+        return None
+
+    def record_poll(self, channel_id: int, new_posts: int, fetched_messages: int = 0):
+        state = self._states.get(channel_id)
+        if state is None:
+            return
+        now = time.time()
+        if state.last_polled is not None:
+            observed = new_posts / max(now - state.last_polled, 1.0)
+            if state.rate_known:
+                state.rate = self.RATE_ALPHA * observed + (1 - self.RATE_ALPHA) * state.rate
+            else:
+                state.rate, state.rate_known = observed, True
+            state.interval = self.compute_interval(state)
+        # Первый опрос забирает накопленную историю, а не отражает частоту — интервал не меняем
+        state.last_polled = now
+        if fetched_messages >= CATCHUP_LIMIT:
+            # Упёрлись в лимит догонялки (он считается в сообщениях, а не в постах:
+            # альбомы и служебные сообщения дают меньше постов) — остаток забираем сразу
+            state.interval = MIN_POLL_INTERVAL
+        state.next_due = now + state.interval
+        state.in_flight = False
+        self._push(state)
+
+    def channels(self) -> list[tuple[Channel, int]]:
+        """Каналы в планировщике (то есть под лизой этой реплики) с числом подписчиков."""
+        return [(state.channel, state.subscribers) for state in self._states.values()]
+
+    def get_channel(self, channel_id: int) -> Channel | None:
+        state = self._states.get(channel_id)
+        return state.channel if state else None
+
+    def poll_all_now(self):
+        """Ставит все каналы на немедленный опрос (догоняем пропущенное после реконнекта)."""
+        now = time.time()
+        for state in self._states.values():
+            if not state.in_flight:
+                state.next_due = now
+                self._push(state)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        return {
+            str(channel_id): {
+                'title': state.channel.title,
+                'account': getattr(telegram_accounts.for_channel(channel_id), 'key', None),
+                'subscribers': state.subscribers,
+                'interval': round(state.interval, 1),
+                'posts_per_hour': round(state.rate * 3600, 2),
+                'lag': round(max(now - state.next_due, 0.0) if not state.in_flight else state.last_lag, 1),
+                'next_poll_in': round(max(state.next_due - now, 0.0), 1),
+            }
+            for channel_id, state in self._states.items()
+        }
+
 class RedisPublisher:
     def __init__(self, redis_url: str):
         self.redis_url = redis_url
@@ -185,21 +560,121 @@ class RedisPublisher:
         if self._pool: 
             await self._pool.disconnect()
 
+class ReplicaLeaseManager:
+    """
+    Делит каналы между репликами воркера. Живые реплики отмечаются в ZSET
+    worker_replicas; каналы распределяются между ними консистентным хешированием,
+    а владение каждым каналом закрепляется истекающим ключом channel_lease:<id>.
+    Лиз гарантирует, что во время перераспределения канал не опрашивают двое.
+    """
+    REPLICAS_KEY = "worker_replicas"
+    LEASE_PREFIX = "channel_lease:"
+    # Продлить свой лиз или захватить свободный
+    ACQUIRE_SCRIPT = """
+        local owner = redis.call('GET', KEYS[1])
+        if owner == ARGV[1] or not owner then
+            redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+            return 1
+        end
+        return 0
+    """
+    # Отпустить лиз, только если он наш
+    RELEASE_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, publisher: RedisPublisher | None, worker_id: str):
+        self.publisher = publisher
+        self.worker_id = worker_id
+        self.owned: set[int] = set()
+        self.replicas: list[str] = [worker_id]
+        self._last_renewed = 0.0
+        self._acquire = self._release = None
+
+    async def _connection(self):
+        conn = await self.publisher.get_connection()
+        if self._acquire is None:
+            self._acquire = conn.register_script(self.ACQUIRE_SCRIPT)
+            self._release = conn.register_script(self.RELEASE_SCRIPT)
+        return conn
+
+    async def _heartbeat(self, conn) -> list[str]:
+        now = time.time()
+        async with conn.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.REPLICAS_KEY, {self.worker_id: now})
+            pipe.zremrangebyscore(self.REPLICAS_KEY, "-inf", now - LEASE_TTL)
+            pipe.zrange(self.REPLICAS_KEY, 0, -1)
+            *_, members = await pipe.execute()
+        return sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+
+    async def claim(self, channel_ids: list[int]) -> set[int]:
+        """Продлевает лизы и возвращает каналы, которые сейчас принадлежат этой реплике."""
+        if self.publisher is None:
+            # Без Redis — одиночный режим, все каналы наши
+            self.owned = set(channel_ids)
+            return self.owned
+        try:
+            conn = await self._connection()
+            self.replicas = await self._heartbeat(conn)
+            ring = ConsistentHashRing(self.replicas)
+            mine = [cid for cid in channel_ids if ring.get(cid) == self.worker_id]
+            foreign = self.owned - set(mine)
+            async with conn.pipeline(transaction=False) as pipe:
+                for cid in mine:
+                    await self._acquire(keys=[f"{self.LEASE_PREFIX}{cid}"], args=[self.worker_id, LEASE_TTL * 1000], client=pipe)
+                for cid in foreign:
+                    await self._release(keys=[f"{self.LEASE_PREFIX}{cid}"], args=[self.worker_id], client=pipe)
+                results = await pipe.execute()
+            self.owned = {cid for cid, acquired in zip(mine, results) if acquired}
+            self._last_renewed = time.time()
+        except Exception as e:
+            logging.error(f"Ошибка продления лизов каналов: {e}")
+            if time.time() - self._last_renewed >= LEASE_TTL:
+                # Наши лизы уже истекли — каналы могли забрать другие реплики
+                self.owned = set()
+        return self.owned
+
+    async def release_all(self):
+        """При остановке сразу отдаем каналы, не дожидаясь истечения лизов."""
+        if self.publisher is None:
+            return
+        try:
+            conn = await self._connection()
+            async with conn.pipeline(transaction=False) as pipe:
+                for cid in self.owned:
+                    await self._release(keys=[f"{self.LEASE_PREFIX}{cid}"], args=[self.worker_id], client=pipe)
+                pipe.zrem(self.REPLICAS_KEY, self.worker_id)
+                await pipe.execute()
+            self.owned = set()
+        except Exception as e:
+            logging.error(f"Ошибка освобождения лизов: {e}")
+
 # ✅ ИНИЦИАЛИЗАЦИЯ КЛИЕНТОВ (ПОСЛЕ ОПРЕДЕЛЕНИЯ КЛАССОВ)
 try:
     print("🔧 Инициализирую клиенты...")
     
-    # Telethon client
-    client = None
-    if SESSION_STRING and API_ID is not None and API_HASH:
-        try:
-            client = TelegramClient(StringSession(SESSION_STRING), API_ID, API_HASH)
-            print(f"  Telethon client: ✅")
-        except Exception as e:
-            print(f"  ❌ Telethon client error: {e}")
-            client = None
+    # Telethon clients
+    telethon_clients: list[tuple[str, TelegramClient]] = []
+    if SESSION_STRINGS and API_ID is not None and API_HASH:
+        for session_string in SESSION_STRINGS:
+            try:
+                # Ключ аккаунта стабилен между рестартами и не раскрывает саму сессию
+                account_key = hashlib.sha256(session_string.encode()).hexdigest()[:12]
+                # flood_sleep_threshold обнуляется в main(): бот импортирует этот же клиент
+                # и зовет его напрямую, без governor, — там короткие FloodWait проспит Telethon
+                telethon_clients.append(
+                    (account_key, TelegramClient(StringSession(session_string), API_ID, API_HASH))
+                )
+                print(f"  Telethon client {account_key}: ✅")
+            except Exception as e:
+                print(f"  ❌ Telethon client error: {e}")
     else:
         print(f"  Telethon client: ❌ (отсутствуют credentials)")
+    # Основной клиент: его же использует бот для проверки каналов
+    client = telethon_clients[0][1] if telethon_clients else None
 
     # Redis publisher
     redis_publisher = None
@@ -221,7 +696,10 @@ try:
                 's3',
                 aws_access_key_id=AWS_ACCESS_KEY_ID,
                 aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-                region_name=S3_REGION
+                region_name=S3_REGION,
+                endpoint_url=S3_ENDPOINT_URL,
+                # Пул соединений под размер пула потоков загрузки
+                config=BotoConfig(max_pool_connections=S3_UPLOAD_THREADS)
             )
             print(f"  S3 client: ✅")
         except Exception as e:
@@ -239,9 +717,15 @@ except Exception as e:
     exit(1)
 
 # ✅ ГЛОБАЛЬНЫЕ INSTANCES
-entity_cache = ThreadSafeEntityCache()
+telegram_accounts = TelegramAccountPool([TelegramAccount(key, c) for key, c in telethon_clients])
 worker_stats = WorkerStats()
+channel_scheduler = AdaptiveChannelScheduler()
+replica_leases = ReplicaLeaseManager(redis_publisher, WORKER_ID)
 s3_semaphore = asyncio.Semaphore(10)
+s3_executor = ThreadPoolExecutor(max_workers=S3_UPLOAD_THREADS, thread_name_prefix="s3-upload")
+transcode_pool: ProcessPoolExecutor | None = None
+# Подключение канала, которое уже идет: остальные задачи по нему ждут тот же результат
+onboarding_in_flight: Dict[int, asyncio.Task] = {}
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 def signal_handler(signum, frame): shutdown_event.set()
@@ -251,46 +735,181 @@ def process_text(text: str | None) -> str | None:
         html = md_parser.renderInline(text)
         return bleach.clean(html.replace('<a href', '<a target="_blank" rel="noopener noreferrer" href'), tags=['a', 'b', 'strong', 'i', 'em', 'pre', 'code', 'br', 's', 'u', 'blockquote'], attributes={'a': ['href', 'title', 'target', 'rel']})
     except Exception: return escape(text or "").replace('\n', '<br>')
+async def resolve_channel_entity(channel: Channel, account: TelegramAccount):
+    """Резолвит канал через Telegram и сохраняет его peer (id + access_hash) в базу."""
+    entity = await account.call('resolve', account.client.get_entity, channel.username or int(channel.id))
+    entity = entity[0] if isinstance(entity, list) else entity
+    access_hash = getattr(entity, 'access_hash', None)
+    if access_hash is not None:
+        async with session_maker() as session:
+            await session.execute(
+                update(Channel)
+                .where(Channel.id == channel.id)
+                .values(peer_id=entity.id, access_hash=access_hash, peer_account=account.key)
+            )
+            await session.commit()
+        channel.peer_id, channel.access_hash, channel.peer_account = entity.id, access_hash, account.key
+    return entity
+
 async def get_cached_entity(channel: Channel):
+    account = telegram_accounts.for_channel(channel.id)
+    if account is None:
+        logging.error("Telethon client is not initialized.")
+        return None
+
     async def fetcher():
-        if client is None:
-            logging.error("Telethon client is not initialized.")
-            return None
-        entity = await client.get_entity(channel.username or int(channel.id))
-        return entity[0] if isinstance(entity, list) else entity
-    return await entity_cache.get_entity(str(channel.id), fetcher)
+        # access_hash привязан к аккаунту: чужой хеш после перешардирования не подойдет.
+        # peer_account=NULL — хеш сохранен до пула аккаунтов, единственной (первой) сессией
+        owner = channel.peer_account or getattr(telegram_accounts.default, 'key', None)
+        if channel.peer_id and channel.access_hash and owner == account.key:
+            # Холодный старт без resolve-запросов: peer из сохраненного access_hash
+            return types.InputPeerChannel(channel_id=channel.peer_id, access_hash=channel.access_hash)
+        return await resolve_channel_entity(channel, account)
+    return await account.entity_cache.get_entity(str(channel.id), fetcher)
+
+async def invalidate_channel_entity(channel: Channel):
+    """Telegram отклонил сохраненный access_hash: сбрасываем его, канал зарезолвится заново."""
+    channel.peer_id = channel.access_hash = channel.peer_account = None
+    account = telegram_accounts.for_channel(channel.id)
+    if account:
+        await account.entity_cache.invalidate(str(channel.id))
+    async with session_maker() as session:
+        await session.execute(
+            update(Channel).where(Channel.id == channel.id).values(peer_id=None, access_hash=None, peer_account=None)
+        )
+        await session.commit()
+
+def start_transcode_pool():
+    """
+    Поднимает процессы транскодинга при старте воркера, пока в нем еще нет потоков,
+    поэтому fork безопасен и дочерние процессы не переимпортируют worker.py.
+    """
+    global transcode_pool
+    if TRANSCODE_WORKERS <= 0:
+        return
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    transcode_pool = ProcessPoolExecutor(max_workers=TRANSCODE_WORKERS, mp_context=context)
+    transcode_pool.submit(transcoder.warm_up).result()
+    logging.info(f"🖼️ Пул транскодинга запущен, процессов: {TRANSCODE_WORKERS}")
+
+async def transcode_to_webp(data: bytes, quality: int) -> bytes:
+    """Перекодирует изображение в WebP в пуле процессов (или в потоке, если пул не запущен)."""
+    if transcode_pool is None:
+        return await asyncio.to_thread(transcoder.to_webp, data, quality)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(transcode_pool, transcoder.to_webp, data, quality)
+
+def s3_public_url(key: str) -> str:
+    return f"https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{key}"
 
-async def upload_avatar_to_s3(telethon_client: TelegramClient, channel_entity) -> str | None:
+async def s3_upload(fileobj, key: str, content_type: str) -> str:
+    """Загружает объект в S3 в пуле потоков, не блокируя event loop. Возвращает публичный URL."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        s3_executor,
+        functools.partial(s3_client.upload_fileobj, fileobj, S3_BUCKET_NAME, key, ExtraArgs={'ContentType': content_type})
+    )
+    return s3_public_url(key)
+
+async def s3_stream_upload(account: TelegramAccount, document, key: str, content_type: str) -> str:
+    """
+    Переливает документ из Telegram в S3 через multipart upload, не буферизуя файл целиком.
+    Пока одна часть заливается, следующая уже скачивается: в памяти не больше двух частей.
+    """
+    loop = asyncio.get_running_loop()
+
+    def run(func, **kwargs):
+        return loop.run_in_executor(s3_executor, functools.partial(func, **kwargs))
+
+    upload = await run(s3_client.create_multipart_upload, Bucket=S3_BUCKET_NAME, Key=key, ContentType=content_type)
+    upload_id = upload['UploadId']
+
+    async def upload_part(part_number: int, data: bytes) -> dict:
+        response = await run(
+            s3_client.upload_part,
+            Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    parts, pending, buffer, part_number = [], None, bytearray(), 0
+    try:
+        async for chunk in account.client.iter_download(document):
+            buffer.extend(chunk)
+            if len(buffer) >= S3_PART_SIZE:
+                if pending:
+                    parts.append(await pending)
+                part_number += 1
+                pending = asyncio.create_task(upload_part(part_number, bytes(buffer)))
+                buffer.clear()
+        if pending:
+            parts.append(await pending)
+            pending = None
+        if buffer or not parts:
+            part_number += 1
+            parts.append(await upload_part(part_number, bytes(buffer)))
+        await run(
+            s3_client.complete_multipart_upload,
+            Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+        )
+    except BaseException:
+        if pending and not pending.done():
+            pending.cancel()
+        try:
+            await run(s3_client.abort_multipart_upload, Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id)
+        except Exception as abort_error:
+            logging.warning(f"Не удалось отменить multipart upload {key}: {abort_error}")
+        raise
+    return s3_public_url(key)
+
+async def upload_avatar_to_s3(account: TelegramAccount, channel_entity) -> str | None:
     if not s3_client or not S3_BUCKET_NAME or not S3_REGION:
         logging.debug("S3 не настроен для загрузки аватаров")
         return None
         
+    # Из кэша приходит InputPeerChannel (channel_id), после resolve — Channel (id)
+    entity_id = getattr(channel_entity, 'id', None) or getattr(channel_entity, 'channel_id', None)
     try:
-        file_key = f"avatars/{channel_entity.id}.jpg"
+        file_key = f"avatars/{entity_id}.jpg"
         file_in_memory = io.BytesIO()
         
-        await telethon_client.download_profile_photo(channel_entity, file=file_in_memory)
+        await account.call('download', account.client.download_profile_photo, channel_entity, file=file_in_memory)
         if file_in_memory.getbuffer().nbytes == 0: 
             return None
             
         file_in_memory.seek(0)
-        s3_client.upload_fileobj(
-            file_in_memory, 
-            S3_BUCKET_NAME, 
-            file_key, 
-            ExtraArgs={'ContentType': 'image/jpeg'}
-        )
-        return f"https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{file_key}"
+        return await s3_upload(file_in_memory, file_key, 'image/jpeg')
         
     except Exception as e:
-        logging.error(f"Ошибка загрузки аватара для {channel_entity.id}: {e}")
+        logging.error(f"Ошибка загрузки аватара для {entity_id}: {e}")
         await worker_stats.increment_errors()  # ✅ Теперь корректно
         return None
 
+def media_cache_key(message: types.Message) -> str | None:
+    """Стабильный ключ медиа: один и тот же файл в репостах имеет тот же photo/document id."""
+    if isinstance(message.media, types.MessageMediaPhoto) and message.media.photo:
+        return f"photo:{message.media.photo.id}"
+    if isinstance(message.media, types.MessageMediaDocument) and message.media.document:
+        return f"document:{message.media.document.id}"
+    return None
+
+async def get_known_media(db_session: AsyncSession, file_keys: list[str]) -> dict[str, dict]:
+    if not file_keys:
+        return {}
+    result = await db_session.execute(
+        select(MediaObject.file_key, MediaObject.media).where(MediaObject.file_key.in_(file_keys))
+    )
+    return {file_key: media for file_key, media in result.all()}
+
 # --- ОСНОВНЫЕ ФУНКЦИИ ВОРКЕРА ---
-async def upload_media_to_s3(message: types.Message, channel_id: int) -> tuple[int, dict | None]:
+async def upload_media_to_s3(
+    message: types.Message,
+    channel_id: int,
+    known_media: dict[str, dict] | None = None
+) -> tuple[int, dict | None]:
     # ✅ ИСПРАВЛЕНИЕ: Проверяем все необходимые компоненты
-    if client is None:
+    # Скачивает тот же аккаунт, что получил сообщение: file reference привязан к нему
+    account = telegram_accounts.for_channel(channel_id)
+    if account is None:
         logging.error("Telethon client не инициализирован!")
         return message.id, None
         
@@ -307,9 +926,9 @@ async def upload_media_to_s3(message: types.Message, channel_id: int) -> tuple[i
         doc = message.media.document
         if not doc:
             return message.id, None
-        if getattr(doc, 'size', 0) > 60 * 1024 * 1024:
+        if getattr(doc, 'size', 0) > MAX_MEDIA_SIZE:
             logging.debug(f"Пропускаю большой файл {message.id}: {getattr(doc, 'size', 0)} bytes")
-            return message.id, None # Пропускаем файлы больше 60MB
+            return message.id, None # Пропускаем файлы больше MAX_MEDIA_SIZE_MB
 
         mime_type = getattr(doc, 'mime_type', '').lower()
         is_sticker = any(isinstance(attr, types.DocumentAttributeSticker) for attr in getattr(doc, 'attributes', []))
@@ -325,6 +944,12 @@ async def upload_media_to_s3(message: types.Message, channel_id: int) -> tuple[i
 
     if not media_type: 
         return message.id, None
+
+    # Уже загружали этот файл (репост или тот же файл в другом канале) — берем готовый URL
+    file_key = media_cache_key(message)
+    if known_media and file_key in known_media:
+        logging.debug(f"♻️ Медиа {file_key} уже в S3, пропускаю загрузку для {message.id}")
+        return message.id, dict(known_media[file_key])
         
     try:
         async with s3_semaphore:
@@ -348,60 +973,52 @@ async def upload_media_to_s3(message: types.Message, channel_id: int) -> tuple[i
                         if file_ext:
                             ext = file_ext
 
-            key = f"media/{channel_id}/{message.id}{ext}"
-            mem_file = io.BytesIO()
-            
-            logging.debug(f"Скачиваю медиа для сообщения {message.id}")
-            await client.download_media(message, file=mem_file)
-            mem_file.seek(0)
-            
-            if media_type == 'photo':
-                try:
-                    with Image.open(mem_file) as im: 
-                        im = im.convert("RGB")
-                        buf = io.BytesIO()
-                        im.save(buf, format="WEBP", quality=80)
-                        buf.seek(0)
-                        mem_file = buf
-                except Exception as img_error:
-                    logging.warning(f"Ошибка конвертации изображения {message.id}: {img_error}")
-                    return message.id, None
-                    
-            logging.debug(f"Загружаю в S3: {key}")
-            s3_client.upload_fileobj(mem_file, S3_BUCKET_NAME, key, ExtraArgs={'ContentType': content_type})
+            # Ключ по id файла в Telegram, чтобы повторная загрузка того же файла перезаписывала тот же объект
+            key_base = f"media/{file_key.replace(':', '/')}" if file_key else f"media/{channel_id}/{message.id}"
+            key = f"{key_base}{ext}"
+
+            if media_type in ('video', 'audio') and getattr(message.media.document, 'size', 0) > STREAM_UPLOAD_THRESHOLD:
+                # Большие файлы не буферизуем целиком: сразу переливаем частями в S3
+                logging.debug(f"Потоково загружаю {message.id} в S3: {key}")
+                # При FloodWait посреди потока multipart отменяется, и загрузка повторяется целиком
+                media_data["url"] = await account.call('download', s3_stream_upload, account, message.media.document, key, content_type)
+            else:
+                mem_file = io.BytesIO()
+
+                logging.debug(f"Скачиваю медиа для сообщения {message.id}")
+                await account.call('download', account.client.download_media, message, file=mem_file)
+                mem_file.seek(0)
+
+                if media_type == 'photo':
+                    try:
+                        mem_file = io.BytesIO(await transcode_to_webp(mem_file.getvalue(), 80))
+                    except Exception as img_error:
+                        logging.warning(f"Ошибка конвертации изображения {message.id}: {img_error}")
+                        return message.id, None
+
+                logging.debug(f"Загружаю в S3: {key}")
+                media_data["url"] = await s3_upload(mem_file, key, content_type)
             media_data["type"] = media_type
-            media_data["url"] = f"https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{key}"
             
             # ✅ ИСПРАВЛЕНИЕ: Безопасная обработка thumbnail для видео
             if media_type == 'video' and isinstance(message.media, types.MessageMediaDocument):
                 document = message.media.document
                 if document and hasattr(document, 'thumbs') and document.thumbs:
                     try:
-                        thumb_key = f"media/{channel_id}/{message.id}_thumb.webp"
+                        thumb_key = f"{key_base}_thumb.webp"
                         thumb_in_memory = io.BytesIO()
                         
                         logging.debug(f"Скачиваю thumbnail для видео {message.id}")
-                        await client.download_media(message, thumb=-1, file=thumb_in_memory)
+                        await account.call('download', account.client.download_media, message, thumb=-1, file=thumb_in_memory)
                         thumb_in_memory.seek(0)
                         
                         if thumb_in_memory.getbuffer().nbytes > 0:
                             # Конвертируем в WebP
                             try:
-                                with Image.open(thumb_in_memory) as im:
-                                    im = im.convert("RGB")
-                                    output_buffer = io.BytesIO()
-                                    im.save(output_buffer, format="WEBP", quality=75)
-                                    output_buffer.seek(0)
-                                    
+                                output_buffer = io.BytesIO(await transcode_to_webp(thumb_in_memory.getvalue(), 75))
+
                                 # Загружаем thumbnail в S3
-                                s3_client.upload_fileobj(
-                                    output_buffer, 
-                                    S3_BUCKET_NAME, 
-                                    thumb_key, 
-                                    ExtraArgs={'ContentType': 'image/webp'}
-                                )
-                                
-                                media_data["thumbnail_url"] = f"https://{S3_BUCKET_NAME}.s3.{S3_REGION}.amazonaws.com/{thumb_key}"
+                                media_data["thumbnail_url"] = await s3_upload(output_buffer, thumb_key, 'image/webp')
                                 logging.debug(f"✅ Thumbnail загружен для видео {message.id}")
                             except Exception as convert_error:
                                 logging.warning(f"Ошибка конвертации thumbnail для {message.id}: {convert_error}")
@@ -418,41 +1035,48 @@ async def upload_media_to_s3(message: types.Message, channel_id: int) -> tuple[i
         await worker_stats.increment_errors()
         return message.id, None
     
-async def create_post_dict(message: types.Message, channel_id: int) -> dict:
-    # Обработка реакций
-    reactions = [
+def serialize_reactions(message_reactions) -> list[dict]:
+    return [
         {
             'count': r.count, 
             'emoticon': getattr(r.reaction, 'emoticon', None), 
             'document_id': getattr(r.reaction, 'document_id', None)
         } 
-        for r in (message.reactions.results if message.reactions else []) 
+        for r in (message_reactions.results if message_reactions else []) 
         if r.count > 0
     ]
+
+async def resolve_forward_source(message: types.Message, account: TelegramAccount | None) -> dict | None:
+    """Источник репоста через общий TTL-кэш: один get_entity на источник, а не на каждый репост."""
+    fwd = message.fwd_from
+    if not fwd:
+        return None
+    if getattr(fwd, 'from_id', None):
+        if account is None:
+            return dict(UNAVAILABLE_FORWARD_SOURCE)
+
+        async def fetcher():
+            source_entity = await account.call('resolve', account.client.get_entity, fwd.from_id)
+            from_name = getattr(source_entity, 'title', getattr(source_entity, 'first_name', 'Неизвестный источник'))
+            username = getattr(source_entity, 'username', None)
+            raw_channel_id = getattr(source_entity, 'id', None)
+            channel_id_str = (
+                str(raw_channel_id)[4:] if raw_channel_id and str(raw_channel_id).startswith('-100') 
+                else str(raw_channel_id) if raw_channel_id else None
+            )
+            return {"from_name": from_name, "username": username, "channel_id": channel_id_str}
+
+        forward_data = await account.forward_cache.get_or_fetch(utils.get_peer_id(fwd.from_id), fetcher)
+        return dict(forward_data) if forward_data else dict(UNAVAILABLE_FORWARD_SOURCE)
+    if hasattr(fwd, 'from_name'):
+        return {"from_name": fwd.from_name, "username": None, "channel_id": None}
+    return None
+
+def create_post_dict(message: types.Message, channel_id: int) -> dict:
+    # Обработка реакций
+    reactions = serialize_reactions(message.reactions)
     
-    # Обработка forwarded_from
-    forward_data = None
-    if message.fwd_from:
-        try:
-            if hasattr(message.fwd_from, 'from_id') and message.fwd_from.from_id:
-                if client is not None:
-                    source_entity = await client.get_entity(message.fwd_from.from_id)
-                    from_name = getattr(source_entity, 'title', getattr(source_entity, 'first_name', 'Неизвестный источник'))
-                    username = getattr(source_entity, 'username', None)
-                    raw_channel_id = getattr(source_entity, 'id', None)
-                    channel_id_str = (
-                        str(raw_channel_id)[4:] if raw_channel_id and str(raw_channel_id).startswith('-100') 
-                        else str(raw_channel_id) if raw_channel_id else None
-                    )
-                    forward_data = {"from_name": from_name, "username": username, "channel_id": channel_id_str}
-                else:
-                    forward_data = {"from_name": "Недоступный источник", "username": None, "channel_id": None}
-            elif hasattr(message.fwd_from, 'from_name'):
-                forward_data = {"from_name": message.fwd_from.from_name, "username": None, "channel_id": None}
-        except Exception as e:
-            logging.warning(f"Не удалось получить entity для репоста: {e}")
-            forward_data = {"from_name": "Недоступный источник", "username": None, "channel_id": None}
-    
+    # forwarded_from заполняется позже и только для постов, которые будут вставлены
     return {
         "channel_id": channel_id,
         "message_id": message.id,
@@ -461,123 +1085,814 @@ async def create_post_dict(message: types.Message, channel_id: int) -> dict:
         "grouped_id": getattr(message, 'grouped_id', None),  # ✅ ИСПРАВЛЕНИЕ: Безопасное получение grouped_id
         "views": getattr(message, 'views', 0) or 0,  # ✅ ИСПРАВЛЕНИЕ: Безопасное получение views
         "reactions": reactions,
-        "forwarded_from": forward_data,
+        "forwarded_from": None,
         "media": []
     }
 
-async def fetch_posts_for_channel(channel: Channel, db_session: AsyncSession, post_limit: int):
-    try:
-        if client is None:
-            logging.error("Telethon client не инициализирован!")
-            return
-            
-        entity = await get_cached_entity(channel)
-        if not entity: 
-            return
-        
-        # Шаг 1: Получаем сообщения из Telegram
-        messages = [
-            msg async for msg in client.iter_messages(entity, limit=post_limit) 
-            if msg and (getattr(msg, 'text', None) or getattr(msg, 'media', None))
-        ]
-        
-        if not messages:
-            return
+def trim_trailing_album(messages: list) -> list:
+    """Отбрасывает хвостовой альбом, который мог быть обрезан лимитом выборки."""
+    last_group = messages[-1].grouped_id if messages else None
+    if not last_group:
+        return messages
+    trimmed = [msg for msg in messages if msg.grouped_id != last_group]
+    return trimmed or messages
 
-        # Шаг 2: Группируем сообщения в альбомы
-        grouped_messages = defaultdict(list)
-        for msg in messages:
-            key = msg.grouped_id or msg.id 
-            grouped_messages[key].append(msg)
-
-        # Шаг 3: Готовим данные для вставки
-        posts_to_prepare = []
-        for group_id, message_group in grouped_messages.items():
-            message_group.sort(key=lambda m: m.id)
-            main_message = message_group[0]
-            
-            # Сразу создаем "скелет" поста, чтобы в дальнейшем добавить в него медиа
-            post_data = await create_post_dict(main_message, channel.id)
-            posts_to_prepare.append({
-                "post_data": post_data,
-                "messages": message_group
-            })
-
-        if not posts_to_prepare:
-            return
+async def store_channel_messages(
+    channel: Channel,
+    db_session: AsyncSession,
+    messages: list,
+    new_cursor: int | None = None,
+    notify_subscribers: bool = True
+) -> int:
+    """
+    Общий путь сохранения для опроса и push-событий: группирует сообщения в посты,
+    загружает медиа только для новых постов и вставляет их. Если передан new_cursor,
+    курсор канала сдвигается в той же транзакции. После коммита id новых постов
+    рассылаются в live-стримы подписчиков. Возвращает число добавленных постов.
+    """
+    messages = [
+        msg for msg in messages
+        if msg and (getattr(msg, 'text', None) or getattr(msg, 'media', None))
+    ]
 
-        # Шаг 4: Скачиваем медиа ТОЛЬКО для тех постов, которых нет в базе
-        main_message_ids = [p['post_data']['message_id'] for p in posts_to_prepare]
+    # Шаг 2: Группируем сообщения в альбомы
+    grouped_messages = defaultdict(list)
+    for msg in messages:
+        key = msg.grouped_id or msg.id 
+        grouped_messages[key].append(msg)
+
+    # Шаг 3: Готовим данные для вставки
+    posts_to_prepare = []
+    for group_id, message_group in grouped_messages.items():
+        message_group.sort(key=lambda m: m.id)
+        main_message = message_group[0]
         
-        stmt_select = select(Post.message_id).where(
+        # Сразу создаем "скелет" поста, чтобы в дальнейшем добавить в него медиа
+        post_data = create_post_dict(main_message, channel.id)
+        posts_to_prepare.append({
+            "post_data": post_data,
+            "messages": message_group
+        })
+
+    # Шаг 4: Скачиваем медиа ТОЛЬКО для тех постов, которых нет в базе.
+    # Пост мог прийти через push, а альбом — начаться до курсора, поэтому сверяем и grouped_id.
+    existing_message_ids, existing_grouped_ids = set(), set()
+    if posts_to_prepare:
+        main_message_ids = [p['post_data']['message_id'] for p in posts_to_prepare]
+        album_ids = [p['post_data']['grouped_id'] for p in posts_to_prepare if p['post_data']['grouped_id']]
+        conditions = [Post.message_id.in_(main_message_ids)]
+        if album_ids:
+            conditions.append(Post.grouped_id.in_(album_ids))
+        stmt_select = select(Post.message_id, Post.grouped_id).where(
             Post.channel_id == channel.id,
-            Post.message_id.in_(main_message_ids)
+            or_(*conditions)
         )
         result = await db_session.execute(stmt_select)
-        existing_message_ids = {row[0] for row in result.fetchall()}
+        for message_id, grouped_id in result.fetchall():
+            existing_message_ids.add(message_id)
+            if grouped_id:
+                existing_grouped_ids.add(grouped_id)
 
-        posts_to_insert = []
-        for item in posts_to_prepare:
-            # Если пост уже существует, мы его пропускаем
-            if item['post_data']['message_id'] in existing_message_ids:
-                continue
+    # Если пост уже существует, мы его пропускаем
+    new_items = [
+        item for item in posts_to_prepare
+        if item['post_data']['message_id'] not in existing_message_ids
+        and item['post_data']['grouped_id'] not in existing_grouped_ids
+    ]
 
-            # Если пост новый, скачиваем для него медиа
-            media_list = []
-            message_group = item['messages']
-            if any(getattr(msg, 'media', None) for msg in message_group):
-                media_upload_tasks = [
-                    upload_media_to_s3(msg_in_group, channel.id)
-                    for msg_in_group in message_group if getattr(msg_in_group, 'media', None)
-                ]
-                media_results = await asyncio.gather(*media_upload_tasks)
-                media_list = [media for _, media in media_results if media]
-
-            final_post_data = item['post_data']
-            final_post_data['media'] = media_list
-            posts_to_insert.append(final_post_data)
-
-        if not posts_to_insert:
-            logging.info(f"Для «{channel.title}» нет новых постов.")
-            return
+    # Источник репоста резолвим только для постов, которые действительно будем вставлять
+    account = telegram_accounts.for_channel(channel.id)
+    forward_sources = await asyncio.gather(*[resolve_forward_source(item['messages'][0], account) for item in new_items])
+    for item, forward_data in zip(new_items, forward_sources):
+        item['post_data']['forwarded_from'] = forward_data
+
+    # Одним запросом узнаем, какие файлы уже лежат в S3
+    file_keys = {
+        media_cache_key(msg) for item in new_items for msg in item['messages'] if getattr(msg, 'media', None)
+    }
+    known_media = await get_known_media(db_session, [key for key in file_keys if key])
 
-        # Шаг 5: Вставляем в БД, позволяя базе данных самой разбираться с конфликтами
+    posts_to_insert, new_media_objects = [], {}
+    for item in new_items:
+        # Если пост новый, скачиваем для него медиа
+        media_list = []
+        message_group = [msg for msg in item['messages'] if getattr(msg, 'media', None)]
+        if message_group:
+            media_upload_tasks = [
+                upload_media_to_s3(msg_in_group, channel.id, known_media)
+                for msg_in_group in message_group
+            ]
+            media_results = await asyncio.gather(*media_upload_tasks)
+            for msg_in_group, (_, media) in zip(message_group, media_results):
+                if not media:
+                    continue
+                media_list.append(media)
+                file_key = media_cache_key(msg_in_group)
+                if file_key and file_key not in known_media:
+                    new_media_objects[file_key] = media
+
+        final_post_data = item['post_data']
+        final_post_data['media'] = media_list
+        posts_to_insert.append(final_post_data)
+
+    # Шаг 5: Вставляем в БД, позволяя базе данных самой разбираться с конфликтами
+    inserted = []
+    if posts_to_insert:
         stmt_insert = insert(Post).values(posts_to_insert)
-        
-        # ВОТ КЛЮЧЕВОЕ ИСПРАВЛЕНИЕ:
         stmt_insert = stmt_insert.on_conflict_do_nothing(
             index_elements=['channel_id', 'message_id']
+        ).returning(Post.id, Post.date)
+        inserted = [(post_id, date) for post_id, date in (await db_session.execute(stmt_insert)).all()]
+
+    if new_media_objects:
+        stmt_media = insert(MediaObject).values(
+            [{"file_key": file_key, "media": media} for file_key, media in new_media_objects.items()]
+        ).on_conflict_do_nothing(index_elements=['file_key'])
+        await db_session.execute(stmt_media)
+
+    # Шаг 6: Сдвигаем курсор в той же транзакции, что и вставка постов
+    if new_cursor:
+        await db_session.execute(
+            update(Channel)
+            .where(Channel.id == channel.id)
+            .values(last_message_id=func.greatest(func.coalesce(Channel.last_message_id, 0), new_cursor))
         )
+    await db_session.commit()
+    if new_cursor:
+        channel.last_message_id = max(channel.last_message_id or 0, new_cursor)
+    if inserted:
+        await fan_out_new_posts(channel.id, inserted, publish=notify_subscribers)
+
+    # Считаем только реально вставленные строки: параллельные опрос, push и backfill
+    # могут прийти с теми же сообщениями, и ON CONFLICT отбросит их у проигравшего
+    if not inserted:
+        logging.info(f"Для «{channel.title}» нет новых постов.")
+        return 0
+
+    logging.info(f"Для «{channel.title}» обработано {len(grouped_messages)} постов/групп. Добавлено новых: {len(inserted)}")
+    await worker_stats.increment_posts(len(inserted))
+    return len(inserted)
+
+async def fan_out_new_posts(channel_id: int, posts: list[tuple[int, datetime]], publish: bool = True):
+    """
+    Рассылает id новых постов в user_feed:<user_id> каждому подписчику канала.
+    Одно сообщение на пользователя (id через запятую), PUBLISH пачками через pipeline:
+    канал с 50k подписчиков — это 50 обращений к Redis, а не 50k.
+    Версии лент подписчиков увеличиваются, чтобы API не отдавал страницы из кеша,
+    а при TIMELINE_STORE посты (id, date) дописываются и в сами ленты.
+    """
+    if not redis_publisher:
+        return
+    try:
+        async with session_maker() as session:
+            user_ids = (await session.execute(
+                select(Subscription.user_id).where(Subscription.channel_id == channel_id)
+            )).scalars().all()
+        if not user_ids:
+            return
+        conn = await redis_publisher.get_connection()
+        await feed_cache.bump_versions(conn, user_ids)
+        if timelines.TIMELINE_STORE:
+            await timelines.push_posts(conn, user_ids, posts)
+        if not publish:
+            return
+        payload = ",".join(str(post_id) for post_id, _ in sorted(posts))
+        for i in range(0, len(user_ids), FANOUT_BATCH):
+            async with conn.pipeline(transaction=False) as pipe:
+                for user_id in user_ids[i:i + FANOUT_BATCH]:
+                    pipe.publish(f"user_feed:{user_id}", payload)
+                await pipe.execute()
+    except Exception as e:
+        # Посты уже в базе, стрим лишь ускоряет доставку
+        logging.error(f"Ошибка рассылки новых постов канала {channel_id}: {e}")
+
+async def iter_messages_list(account: TelegramAccount, entity, limit: int, **kwargs) -> list:
+    """iter_messages через governor. При FloodWait выборка повторяется целиком."""
+    async def collect():
+        return [msg async for msg in account.client.iter_messages(entity, limit=limit, **kwargs) if msg]
+    # Telethon забирает историю пачками по 100 сообщений
+    return await account.call('history', collect, cost=max(math.ceil(limit / 100), 1))
+
+async def fetch_new_messages(channel: Channel, entity, post_limit: int) -> tuple[list, int]:
+    """Возвращает сообщения и сколько их пришло от Telegram (до обрезки хвостового альбома)."""
+    account = telegram_accounts.for_channel(channel.id)
+    cursor = channel.last_message_id
+    if cursor:
+        # Инкрементальный режим: только сообщения новее курсора, от старых к новым.
+        # Если новых больше лимита, остаток заберем в следующем цикле, ничего не теряя.
+        raw_messages = await iter_messages_list(account, entity, CATCHUP_LIMIT, min_id=cursor, reverse=True)
+        fetched = len(raw_messages)
+        if fetched >= CATCHUP_LIMIT:
+            raw_messages = trim_trailing_album(raw_messages)
+        return raw_messages, fetched
+    raw_messages = await iter_messages_list(account, entity, post_limit)
+    return raw_messages, len(raw_messages)
+
+async def sync_channel_posts(channel: Channel, db_session: AsyncSession, post_limit: int) -> tuple[int, int]:
+    """
+    Забирает новые посты канала и сохраняет их. Ошибки не перехватывает.
+    Возвращает (сохранено постов, получено сообщений от Telegram).
+    """
+    if telegram_accounts.for_channel(channel.id) is None:
+        logging.error("Telethon client не инициализирован!")
+        return 0, 0
         
-        await db_session.execute(stmt_insert)
-        await db_session.commit()
+    entity = await get_cached_entity(channel)
+    if not entity: 
+        return 0, 0
+    
+    # Шаг 1: Получаем сообщения из Telegram
+    try:
+        raw_messages, fetched = await fetch_new_messages(channel, entity, post_limit)
+    except (ChannelInvalidError, PeerIdInvalidError):
+        if not channel.access_hash:
+            raise
+        # Сохраненный access_hash больше не принимается — резолвим канал заново один раз
+        logging.warning(f"🔑 access_hash для «{channel.title}» отклонен, резолвлю канал заново")
+        await invalidate_channel_entity(channel)
+        entity = await get_cached_entity(channel)
+        if not entity:
+            return 0, 0
+        raw_messages, fetched = await fetch_new_messages(channel, entity, post_limit)
 
-        logging.info(f"Для «{channel.title}» обработано {len(grouped_messages)} постов/групп. Добавлено новых: {len(posts_to_insert)}")
-        if posts_to_insert:
-            await worker_stats.increment_posts(len(posts_to_insert))
-            
+    if not raw_messages:
+        return 0, fetched
+
+    # Курсор двигаем по всем полученным сообщениям, включая служебные и пустые
+    new_cursor = max(msg.id for msg in raw_messages)
+    stored = await store_channel_messages(channel, db_session, raw_messages, new_cursor=new_cursor)
+    return stored, fetched
+
+async def fetch_posts_for_channel(channel: Channel, db_session: AsyncSession, post_limit: int) -> tuple[int, int]:
+    try:
+        return await sync_channel_posts(channel, db_session, post_limit)
     except Exception as e:
         logging.error(f"Критическая ошибка при обработке «{channel.title}»: {e}", exc_info=True)
         await worker_stats.increment_errors()
         await db_session.rollback()
+        return 0, 0
+
+async def process_channel_safely(channel: Channel) -> tuple[int, int]:
+    async with session_maker() as session:
+        return await fetch_posts_for_channel(channel, session, POST_LIMIT)
+
+async def load_subscribed_channels() -> list[tuple[Channel, int]]:
+    """Возвращает каналы с подписчиками вместе с числом подписчиков."""
+    async with session_maker() as session:
+        stmt = (
+            select(Channel, func.count(Subscription.id))
+            .join(Subscription, Subscription.channel_id == Channel.id)
+            .group_by(Channel.id)
+        )
+        return [(channel, count) for channel, count in (await session.execute(stmt)).all()]
+
+async def refresh_scheduled_channels():
+    """
+    Периодически синхронизирует планировщик со списком каналов в базе.
+    Список из базы обновляется раз в CHANNEL_REFRESH_INTERVAL, а лизы — чаще,
+    чтобы не истечь: в планировщик попадают только каналы этой реплики.
+    Запросов к Telegram здесь нет — их паузы не должны задерживать продление лиз.
+    """
+    channels, loaded_at = [], 0.0
+    while not shutdown_event.is_set():
+        try:
+            if time.time() - loaded_at >= CHANNEL_REFRESH_INTERVAL:
+                channels, loaded_at = await load_subscribed_channels(), time.time()
+            owned = await replica_leases.claim([channel.id for channel, _ in channels])
+            owned_channels = [(channel, count) for channel, count in channels if channel.id in owned]
+            channel_scheduler.sync_channels(owned_channels)
+            await worker_stats.set_channels(len(owned_channels))
+        except Exception as e:
+            logging.error(f"Ошибка обновления списка каналов: {e}", exc_info=True)
+            await worker_stats.increment_errors()
+        try: await asyncio.wait_for(shutdown_event.wait(), timeout=LEASE_RENEW_INTERVAL)
+        except asyncio.TimeoutError: pass
+    await replica_leases.release_all()
+
+async def push_channel_joiner():
+    """Отдельно от продления лиз: вступления упираются в лимиты Telegram и идут минутами."""
+    while not shutdown_event.is_set():
+        try:
+            await join_channels_for_push(channel_scheduler.channels())
+        except Exception as e:
+            logging.error(f"Ошибка вступления в каналы для push: {e}", exc_info=True)
+            await worker_stats.increment_errors()
+        try: await asyncio.wait_for(shutdown_event.wait(), timeout=LEASE_RENEW_INTERVAL)
+        except asyncio.TimeoutError: pass
 
-async def process_channel_safely(channel: Channel, semaphore: asyncio.Semaphore):
-    async with semaphore, session_maker() as session:
-        await fetch_posts_for_channel(channel, session, POST_LIMIT)
+async def scheduled_poller(worker_no: int):
+    """Берет из планировщика каналы, срок опроса которых наступил, и опрашивает их."""
+    while not shutdown_event.is_set():
+        state = await channel_scheduler.next_due()
+        if state is None:
+            continue
+        new_posts, fetched = 0, 0
+        try:
+            new_posts, fetched = await process_channel_safely(state.channel)
+        finally:
+            channel_scheduler.record_poll(state.channel.id, new_posts, fetched)
 
 async def periodic_tasks_runner():
+    logging.info(f"Запускаю адаптивный планировщик опроса ({SCHEDULER_CONCURRENCY} потоков)...")
+    await asyncio.gather(
+        refresh_scheduled_channels(),
+        *([push_channel_joiner()] if PUSH_INGESTION else []),
+        *[scheduled_poller(i) for i in range(SCHEDULER_CONCURRENCY)]
+    )
+    logging.info("Планировщик опроса остановлен.")
+
+async def select_posts_for_engagement_refresh(session: AsyncSession) -> dict[int, list[int]]:
+    """Свежие посты, которым пора обновить просмотры/реакции: чем старше пост, тем реже."""
+    now = datetime.now(timezone.utc)
+    conditions, newer_than = [], now
+    for max_age, refresh_every in ENGAGEMENT_TIERS:
+        conditions.append(and_(
+            Post.date <= newer_than,
+            Post.date > now - max_age,
+            Post.updated_at < now - refresh_every
+        ))
+        newer_than = now - max_age
+    result = await session.execute(
+        select(Post.channel_id, Post.message_id).where(or_(*conditions)).order_by(Post.channel_id)
+    )
+    by_channel = defaultdict(list)
+    for channel_id, message_id in result.all():
+        by_channel[channel_id].append(message_id)
+    return by_channel
+
+async def fetch_engagement(account: TelegramAccount, entity, message_ids: list[int]) -> list[tuple[int, int, str | None]]:
+    """Пачкой забирает просмотры и реакции. Возвращает (message_id, views, reactions_json | None)."""
+    views_result = await account.call(
+        'engagement', account.client, functions.messages.GetMessagesViewsRequest(peer=entity, id=message_ids, increment=False)
+    )
+    reactions_by_id = {}
+    updates = await account.call(
+        'engagement', account.client, functions.messages.GetMessagesReactionsRequest(peer=entity, id=message_ids)
+    )
+    for upd in getattr(updates, 'updates', []):
+        if isinstance(upd, types.UpdateMessageReactions):
+            reactions_by_id[upd.msg_id] = json.dumps(serialize_reactions(upd.reactions))
+    return [
+        (message_id, item.views or 0, reactions_by_id.get(message_id))
+        for message_id, item in zip(message_ids, views_result.views)
+    ]
+
+async def refresh_channel_engagement(channel: Channel, message_ids: list[int]) -> int:
+    account = telegram_accounts.for_channel(channel.id)
+    entity = await get_cached_entity(channel)
+    if not entity:
+        return 0
+    rows = []
+    for i in range(0, len(message_ids), ENGAGEMENT_BATCH):
+        rows.extend(await fetch_engagement(account, entity, message_ids[i:i + ENGAGEMENT_BATCH]))
+    if not rows:
+        return 0
+
+    # Один UPDATE ... FROM (VALUES ...) на канал. Реакции, которых нет в ответе, не трогаем.
+    engagement = values(
+        column('message_id', BigInteger), column('views', BigInteger), column('reactions', Text),
+        name='engagement'
+    ).data(rows)
+    stmt = (
+        update(Post)
+        .where(Post.channel_id == channel.id, Post.message_id == engagement.c.message_id)
+        .values(
+            views=engagement.c.views,
+            reactions=func.coalesce(cast(engagement.c.reactions, JSONB), Post.reactions),
+            updated_at=func.now()
+        )
+    )
+    async with session_maker() as session:
+        await session.execute(stmt)
+        await session.commit()
+    return len(rows)
+
+async def engagement_refresher():
+    """Периодически обновляет просмотры и реакции свежих постов."""
     while not shutdown_event.is_set():
-        logging.info("Начинаю периодический сбор постов...")
-        async with session_maker() as session:
-            channels = (await session.execute(select(Channel).join(Subscription).distinct())).scalars().all()
-        await worker_stats.set_channels(len(channels))
-        if channels:
-            semaphore = asyncio.Semaphore(15)
-            await asyncio.gather(*[process_channel_safely(ch, semaphore) for ch in channels])
-        logging.info("Периодический сбор завершен.")
-        try: await asyncio.wait_for(shutdown_event.wait(), timeout=SLEEP_TIME)
+        try: await asyncio.wait_for(shutdown_event.wait(), timeout=ENGAGEMENT_TICK)
         except asyncio.TimeoutError: pass
-        
+        if shutdown_event.is_set():
+            break
+        try:
+            async with session_maker() as session:
+                by_channel = await select_posts_for_engagement_refresh(session)
+            refreshed = 0
+            for channel_id, message_ids in by_channel.items():
+                channel = channel_scheduler.get_channel(channel_id)
+                if channel is None:
+                    continue  # Канал без подписчиков
+                try:
+                    refreshed += await refresh_channel_engagement(channel, message_ids)
+                except Exception as e:
+                    logging.warning(f"Не удалось обновить просмотры «{channel.title}»: {e}")
+                    await worker_stats.increment_errors()
+            if refreshed:
+                logging.info(f"👁️ Обновлены просмотры/реакции для {refreshed} постов")
+        except Exception as e:
+            logging.error(f"Ошибка обновления просмотров: {e}", exc_info=True)
+            await worker_stats.increment_errors()
+
+async def backfill_channel(channel: Channel, on_posts=None) -> int | None:
+    """
+    Догружает историю канала вглубь (offset_id от самого старого сохраненного поста),
+    пока не будут покрыты BACKFILL_DEPTH последних сообщений. on_posts вызывается после
+    первой страницы, давшей новые посты. Возвращает число добавленных постов,
+    None — если канал догрузить не удалось.
+    """
+    account = telegram_accounts.for_channel(channel.id)
+    if account is None:
+        return None
+    added = 0
+    async with session_maker() as session:
+        try:
+            entity = await get_cached_entity(channel)
+            if not entity:
+                return None
+            newest_id, oldest_id = (await session.execute(
+                select(func.max(Post.message_id), func.min(Post.message_id)).where(Post.channel_id == channel.id)
+            )).one()
+            # Глубина считается в сообщениях, как и страницы ниже: id сообщений в канале
+            # идут подряд, а постов меньше из-за альбомов и служебных сообщений
+            newest_id = max(newest_id or 0, channel.last_message_id or 0)
+            covered = newest_id - oldest_id + 1 if oldest_id else 0
+            remaining, offset_id = BACKFILL_DEPTH - covered, oldest_id or 0
+            while remaining > 0 and not shutdown_event.is_set():
+                limit = min(BACKFILL_PAGE, remaining)
+                raw_messages = await iter_messages_list(account, entity, limit, offset_id=offset_id)
+                if not raw_messages:
+                    break
+                # Самый старый альбом страницы мог обрезаться — дочитаем его следующей страницей
+                page = trim_trailing_album(raw_messages) if len(raw_messages) >= limit else raw_messages
+                # Канал еще не опрашивался: первая страница — самые свежие сообщения, от них и курсор
+                new_cursor = max(msg.id for msg in page) if not channel.last_message_id and not offset_id else None
+                # Старые посты в live-стримы не рассылаем: прогресс сообщает on_posts
+                new_posts = await store_channel_messages(
+                    channel, session, page, new_cursor=new_cursor, notify_subscribers=False
+                )
+                if new_posts and not added and on_posts:
+                    await on_posts(channel)
+                added += new_posts
+                remaining -= len(page)
+                offset_id = min(msg.id for msg in page)
+                if len(raw_messages) < limit:
+                    break  # История канала закончилась
+        except Exception as e:
+            logging.error(f"Ошибка дозагрузки истории «{channel.title}»: {e}", exc_info=True)
+            await worker_stats.increment_errors()
+            await session.rollback()
+            return added or None
+    return added
+
+async def claim_backfill_request(user_id: int) -> bool:
+    """Заявку обрабатывает одна реплика: захватываем ее истекающим ключом в Redis."""
+    if not redis_publisher:
+        return True
+    conn = await redis_publisher.get_connection()
+    return bool(await conn.set(f"backfill_lease:{user_id}", WORKER_ID, nx=True, ex=BACKFILL_LEASE_TTL))
+
+async def publish_backfill_progress(user_id: int, channel: Channel):
+    """Отправляет в ленту пользователя свежий пост канала: фронтенд выходит из состояния backfilling."""
+    if not redis_publisher:
+        return
+    async with session_maker() as session:
+        post_id = await session.scalar(
+            select(Post.id).where(Post.channel_id == channel.id).order_by(Post.date.desc()).limit(1)
+        )
+    if post_id:
+        await redis_publisher.publish(f"user_feed:{user_id}", str(post_id))
+
+async def process_backfill_request(user_id: int) -> tuple[int, int]:
+    """Возвращает (добавлено постов, каналов, которые догрузить не удалось)."""
+    async with session_maker() as session:
+        channels = list((await session.execute(
+            select(Channel).join(Subscription, Subscription.channel_id == Channel.id).where(Subscription.user_id == user_id)
+        )).scalars().all())
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+    on_posts = functools.partial(publish_backfill_progress, user_id)
+
+    async def run(channel: Channel) -> int | None:
+        async with semaphore:
+            return await backfill_channel(channel, on_posts)
+
+    results = await asyncio.gather(*[run(channel) for channel in channels])
+    return sum(r for r in results if r), sum(1 for r in results if r is None)
+
+async def backfill_consumer():
+    """Разбирает заявки backfill_requests от API, не дожидаясь планового опроса каналов."""
+    while not shutdown_event.is_set():
+        try:
+            async with session_maker() as session:
+                requests = (await session.execute(
+                    select(BackfillRequest).order_by(BackfillRequest.created_at).limit(10)
+                )).scalars().all()
+            for request in requests:
+                if shutdown_event.is_set():
+                    break
+                if not await claim_backfill_request(request.user_id):
+                    continue  # Заявку уже обрабатывает другая реплика
+                logging.info(f"⏬ Дозагрузка истории для пользователя {request.user_id}")
+                added, failed = await process_backfill_request(request.user_id)
+                expired = datetime.now(timezone.utc) - request.created_at > BACKFILL_REQUEST_MAX_AGE
+                if failed and not added and not expired:
+                    # Ничего не догрузили (entity, FloodWait): заявка остается, лиза не снимается —
+                    # повтор после ее истечения через BACKFILL_LEASE_TTL
+                    logging.warning(f"⚠️ Дозагрузка для пользователя {request.user_id} не удалась, повторю позже")
+                    continue
+                async with session_maker() as session:
+                    await session.execute(delete(BackfillRequest).where(BackfillRequest.id == request.id))
+                    await session.commit()
+                if redis_publisher:
+                    conn = await redis_publisher.get_connection()
+                    await conn.delete(f"backfill_lease:{request.user_id}")
+                logging.info(f"✅ Дозагрузка для пользователя {request.user_id} завершена, добавлено постов: {added}")
+        except Exception as e:
+            logging.error(f"Ошибка обработки заявок на дозагрузку: {e}", exc_info=True)
+            await worker_stats.increment_errors()
+        try: await asyncio.wait_for(shutdown_event.wait(), timeout=BACKFILL_POLL_INTERVAL)
+        except asyncio.TimeoutError: pass
+
+async def join_channels_for_push(channels: list[tuple[Channel, int]]):
+    """Каждый аккаунт вступает в свои каналы, чтобы получать по ним update-события."""
+    by_account = defaultdict(list)
+    for channel, _ in channels:
+        account = telegram_accounts.for_channel(channel.id)
+        if account:
+            by_account[account.key].append(channel)
+    for account in telegram_accounts:
+        await join_account_channels(account, by_account.get(account.key, []))
+
+async def join_account_channels(account: TelegramAccount, channels: list[Channel]):
+    """За раз — не больше PUSH_JOIN_BATCH вступлений на аккаунт."""
+    if account.governor.paused_for('join') > 0:
+        return  # Вступления аккаунта еще под FloodWait
+    if not account.joined_channels_loaded:
+        # Один запрос диалогов вместо проверки членства по каждому каналу после рестарта
+        dialogs = await account.call('other', account.client.get_dialogs)
+        account.joined_channels.update(dialog.id for dialog in dialogs if dialog.is_channel)
+        account.joined_channels_loaded = True
+    joins = 0
+    for channel in channels:
+        if channel.id in account.joined_channels:
+            continue
+        if joins >= PUSH_JOIN_BATCH:
+            break
+        entity = await get_cached_entity(channel)
+        if not entity:
+            continue
+        try:
+            # Членство уже сверено по диалогам: у InputPeerChannel из кэша нет поля left
+            # Без повторов: FloodWait сразу доходит сюда и откладывает вступления до следующего круга
+            await account.call('join', account.client, functions.channels.JoinChannelRequest(entity), retries=0)
+            joins += 1
+            logging.info(f"📡 Аккаунт {account.key} вступил в «{channel.title}» для push-обновлений")
+            account.joined_channels.add(channel.id)
+        except FloodWaitError as e:
+            logging.warning(f"⏳ FloodWait {e.seconds}с при вступлении в каналы, продолжу позже")
+            return
+        except Exception as e:
+            logging.error(f"Не удалось вступить в «{channel.title}»: {e}")
+
+async def ingest_pushed_messages(messages: list, telethon_client):
+    """Сохраняет посты, пришедшие через update-события. Курсор не двигаем: пропуски закрывает опрос."""
+    if not messages:
+        return
+    channel = channel_scheduler.get_channel(messages[0].chat_id)
+    if channel is None:
+        return  # Канал без подписчиков
+    account = telegram_accounts.for_channel(channel.id)
+    if account is None or account.client is not telethon_client:
+        return  # Канал обслуживает другой аккаунт пула
+    async with session_maker() as session:
+        try:
+            inserted = await store_channel_messages(channel, session, messages)
+            if inserted:
+                logging.info(f"⚡ Push: «{channel.title}» +{inserted}")
+        except Exception as e:
+            logging.error(f"Ошибка обработки push-сообщений «{channel.title}»: {e}", exc_info=True)
+            await worker_stats.increment_errors()
+            await session.rollback()
+
+async def handle_new_message_event(event):
+    await ingest_pushed_messages([event.message], event.client)
+
+async def handle_album_event(event):
+    await ingest_pushed_messages(list(event.messages), event.client)
+
+async def push_connection_watchdog():
+    """После переподключения любого клиента запускает догоняющий опрос всех каналов."""
+    while not shutdown_event.is_set():
+        try: await asyncio.wait_for(shutdown_event.wait(), timeout=5)
+        except asyncio.TimeoutError: pass
+        for account in telegram_accounts:
+            connected = account.client.is_connected()
+            if connected and not account.was_connected:
+                logging.info(f"🔌 Аккаунт {account.key} переподключился, догоняю пропущенные посты опросом")
+                channel_scheduler.poll_all_now()
+            account.was_connected = connected
+
+async def stats_reporter():
+    """Раз в минуту пишет статистику воркера в лог и в Redis (ключ worker_stats:<WORKER_ID>)."""
+    while not shutdown_event.is_set():
+        try: await asyncio.wait_for(shutdown_event.wait(), timeout=STATS_INTERVAL)
+        except asyncio.TimeoutError: pass
+        try:
+            stats = await worker_stats.get_stats()
+            stats['channels'] = channel_scheduler.snapshot()
+            stats['telegram'] = {account.key: account.governor.snapshot() for account in telegram_accounts}
+            stats['replica'] = {'id': WORKER_ID, 'replicas': replica_leases.replicas}
+            if redis_publisher:
+                stats['new_channel_queue'] = await new_channel_queue_depth(await redis_publisher.get_connection())
+            throttled = sum(t['throttled_seconds'] for t in stats['telegram'].values())
+            overdue = [c for c in stats['channels'].values() if c['lag'] > 0]
+            logging.info(
+                f"📊 Реплика {WORKER_ID} ({len(replica_leases.replicas)} всего), "
+                f"каналов: {len(stats['channels'])}, просрочено: {len(overdue)}, "
+                f"постов: {stats['processed_posts']}, ошибок: {stats['errors']}, "
+                f"ожидание лимитов Telegram: {throttled:.1f}с"
+            )
+            if redis_publisher:
+                conn = await redis_publisher.get_connection()
+                # У каждой реплики своя статистика
+                await conn.set(f"worker_stats:{WORKER_ID}", json.dumps(stats), ex=STATS_INTERVAL * 3)
+        except Exception as e:
+            logging.error(f"Ошибка публикации статистики: {e}")
+
+class PermanentJobError(Exception):
+    """Задачу бессмысленно повторять — она сразу уходит в dead-letter."""
+
+PERMANENT_JOB_ERRORS = (PermanentJobError, ChannelPrivateError)
+
+def decode_job_fields(fields: dict) -> dict:
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in fields.items()
+    }
+
+def parse_new_channel_job(fields: dict) -> dict:
+    """Разбирает payload задачи. Неразборчивая задача не исправится повтором."""
+    try:
+        task = json.loads(fields["payload"])
+        return {
+            "channel_id": int(task["channel_id"]),
+            "user_chat_id": int(task["user_chat_id"]),
+            "channel_title": task.get("channel_title"),
+        }
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError, AttributeError) as e:
+        raise PermanentJobError(f"Некорректная задача: {e!r}") from e
+
+async def ensure_job_group(conn):
+    try:
+        await conn.xgroup_create(NEW_CHANNEL_STREAM, NEW_CHANNEL_GROUP, id="0", mkstream=True)
+    except aioredis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+async def migrate_legacy_channel_tasks(conn):
+    """Задачи, оставшиеся в старом списке new_channel_tasks, переносим в поток."""
+    moved = 0
+    while (task_raw := await conn.rpop("new_channel_tasks")):
+        job_id = uuid.uuid4().hex
+        await conn.xadd(NEW_CHANNEL_STREAM, {"job_id": job_id, "payload": task_raw, "attempt": 0})
+        moved += 1
+    if moved:
+        logging.info(f"📦 Перенесено задач из new_channel_tasks в поток: {moved}")
+
+async def onboard_channel(channel_id: int, title: str | None):
+    """Подключает новый канал: аватар и первые посты. У каждого подключения своя сессия БД."""
+    async with session_maker() as session:
+        channel = await session.get(Channel, channel_id)
+        if not channel:
+            raise PermanentJobError(f"Канал с ID {channel_id} не найден в базе данных")
+        logging.info(f"📥 Начинаю загрузку постов из «{title}»...")
+
+        entity = await get_cached_entity(channel)
+        account = telegram_accounts.for_channel(channel.id)
+        if entity and account is not None:
+            logging.info(f"🖼️ Загружаю аватар для «{title}»...")
+            avatar_url = await upload_avatar_to_s3(account, entity)
+            if avatar_url:
+                channel.avatar_url = avatar_url
+                session.add(channel)
+                await session.commit()
+                logging.info(f"✅ Аватар загружен для «{title}»")
+
+        # В отличие от планового опроса, ошибка здесь не глотается: задача уйдет на повтор
+        await sync_channel_posts(channel, session, POST_LIMIT)
+
+async def onboard_channel_once(channel_id: int, title: str | None):
+    """Одновременные задачи по одному каналу обслуживает одна загрузка."""
+    task = onboarding_in_flight.get(channel_id)
+    if task is None:
+        task = asyncio.create_task(onboard_channel(channel_id, title), name=f"onboard:{channel_id}")
+        onboarding_in_flight[channel_id] = task
+        task.add_done_callback(lambda _: onboarding_in_flight.pop(channel_id, None))
+    else:
+        logging.info(f"🔗 Канал «{title}» уже загружается, жду общий результат")
+    # shield: отмена одной задачи не прерывает загрузку, которую ждут другие
+    await asyncio.shield(task)
+
+async def process_new_channel_job(task: dict):
+    """Подключает канал и уведомляет пользователя. Ошибки пробрасывает наверх."""
+    channel_id = task["channel_id"]
+    chat_id = task["user_chat_id"]
+    title = task["channel_title"]
+
+    logging.info(f"🆕 НОВЫЙ КАНАЛ: Обрабатываю канал «{title}» (ID: {channel_id}) для пользователя {chat_id}")
+    await onboard_channel_once(channel_id, title)
+
+    # ОТПРАВКА УВЕДОМЛЕНИЯ
+    completion = {"user_chat_id": chat_id, "channel_title": title}
+    await redis_publisher.publish("task_completion_notifications", json.dumps(completion))
+    logging.info(f"🎉 Канал «{title}» обработан, уведомление отправлено пользователю {chat_id}")
+
+async def handle_new_channel_entry(conn, entry_id, fields: dict):
+    """
+    Обрабатывает одну запись потока. XACK — только после коммита постов; упавшая
+    задача возвращается в поток с экспоненциальной задержкой, после JOB_MAX_ATTEMPTS
+    или при неисправимой ошибке — уходит в NEW_CHANNEL_DEAD.
+    """
+    fields = decode_job_fields(fields)
+    job_id = fields.get("job_id") or str(entry_id)
+    attempt = int(fields.get("attempt") or 0)
+    done_key = f"job_done:{job_id}"
+    async with conn.pipeline(transaction=True) as pipe:
+        try:
+            if await conn.exists(done_key):
+                logging.info(f"ℹ️ Задача {job_id} уже выполнена, пропускаю дубликат")
+            else:
+                await process_new_channel_job(parse_new_channel_job(fields))
+                pipe.set(done_key, 1, ex=JOB_DONE_TTL)
+        except PERMANENT_JOB_ERRORS as e:
+            logging.error(f"❌ Задача {job_id} отклонена: {e}")
+            pipe.xadd(NEW_CHANNEL_DEAD, {**fields, "error": str(e)[:500]}, maxlen=10000, approximate=True)
+        except Exception as e:
+            await worker_stats.increment_errors()
+            if attempt + 1 >= JOB_MAX_ATTEMPTS:
+                logging.error(f"❌ Задача {job_id} не выполнена за {JOB_MAX_ATTEMPTS} попыток: {e}", exc_info=True)
+                pipe.xadd(NEW_CHANNEL_DEAD, {**fields, "error": str(e)[:500]}, maxlen=10000, approximate=True)
+            else:
+                delay = JOB_BACKOFF_BASE * 2 ** attempt
+                logging.warning(f"🔁 Задача {job_id} упала ({e}), повтор через {delay}с")
+                pipe.zadd(NEW_CHANNEL_DELAYED, {json.dumps({**fields, "attempt": attempt + 1}): time.time() + delay})
+        pipe.xack(NEW_CHANNEL_STREAM, NEW_CHANNEL_GROUP, entry_id)
+        await pipe.execute()
+
+async def release_delayed_jobs(conn):
+    """Возвращает в поток задачи, у которых истекла задержка перед повтором."""
+    for member in await conn.zrangebyscore(NEW_CHANNEL_DELAYED, "-inf", time.time(), start=0, num=100):
+        # ZREM выигрывает только одна реплика
+        if await conn.zrem(NEW_CHANNEL_DELAYED, member):
+            await conn.xadd(NEW_CHANNEL_STREAM, json.loads(member))
+
+async def run_new_channel_entry(conn, entry_id, fields: dict):
+    try:
+        await handle_new_channel_entry(conn, entry_id, fields)
+    except Exception as e:
+        # Без ACK задача останется в pending и будет забрана повторно
+        logging.error(f"❌ Ошибка обработки задачи {entry_id}: {e}", exc_info=True)
+        await worker_stats.increment_errors()
+
+async def reclaim_stale_jobs(conn, count: int) -> list:
+    """Забирает задачи, зависшие у упавшей реплики. Задачу, которая валит воркер, отправляет в dead-letter."""
+    _, entries, *_ = await conn.xautoclaim(
+        NEW_CHANNEL_STREAM, NEW_CHANNEL_GROUP, WORKER_ID, min_idle_time=JOB_CLAIM_IDLE, start_id="0-0", count=count
+    )
+    alive = []
+    for entry_id, fields in entries:
+        if not fields:
+            continue  # Запись уже удалена из потока
+        pending = await conn.xpending_range(NEW_CHANNEL_STREAM, NEW_CHANNEL_GROUP, min=entry_id, max=entry_id, count=1)
+        if pending and pending[0]["times_delivered"] > JOB_MAX_ATTEMPTS:
+            async with conn.pipeline(transaction=True) as pipe:
+                pipe.xadd(NEW_CHANNEL_DEAD, {**decode_job_fields(fields), "error": "worker crashed"}, maxlen=10000, approximate=True)
+                pipe.xack(NEW_CHANNEL_STREAM, NEW_CHANNEL_GROUP, entry_id)
+                await pipe.execute()
+        else:
+            alive.append((entry_id, fields))
+    return alive
+
+async def refresh_in_flight_jobs(conn, entry_ids: list):
+    """Сбрасывает idle у записей, которые эта реплика еще обрабатывает (счетчик доставок не растет)."""
+    if entry_ids:
+        await conn.xclaim(
+            NEW_CHANNEL_STREAM, NEW_CHANNEL_GROUP, WORKER_ID, min_idle_time=0, message_ids=entry_ids, justid=True
+        )
+
+async def new_channel_queue_depth(conn) -> dict:
+    """Глубина очереди: непрочитанные (lag), взятые без ACK (pending), ожидающие повтора и мертвые."""
+    try:
+        groups = await conn.xinfo_groups(NEW_CHANNEL_STREAM)
+    except aioredis.ResponseError:
+        groups = []  # Поток еще не создан
+    group = next((g for g in groups if g["name"] in (NEW_CHANNEL_GROUP, NEW_CHANNEL_GROUP.encode())), {})
+    return {
+        'lag': group.get('lag') or 0,
+        'pending': group.get('pending') or 0,
+        'delayed': await conn.zcard(NEW_CHANNEL_DELAYED),
+        'dead': await conn.xlen(NEW_CHANNEL_DEAD),
+    }
+
 async def listen_for_new_channel_tasks():
     if not redis_publisher: 
         logging.warning("❌ Redis publisher не настроен - новые каналы не будут обрабатываться автоматически!")
@@ -588,75 +1903,67 @@ async def listen_for_new_channel_tasks():
     
     try:
         redis_client = await redis_publisher.get_connection()
+        await ensure_job_group(redis_client)
+        await migrate_legacy_channel_tasks(redis_client)
         logging.info("✅ Redis подключение установлено для слушания задач")
     except Exception as e:
         logging.error(f"❌ Ошибка подключения к Redis: {e}")
         return
     
+    # Задачи обрабатываются параллельно, но не больше ONBOARDING_CONCURRENCY одновременно:
+    # из потока читаем ровно столько, сколько есть свободных мест
+    active: Dict[asyncio.Task, Any] = {}  # Задача -> id записи в потоке
+    last_reclaim = last_heartbeat = 0.0
     while not shutdown_event.is_set():
         try:
-            logging.debug("⏳ Ожидание задач из Redis...")  # Для отладки
-            
-            task_raw = await redis_client.brpop("new_channel_tasks", timeout=1) # type: ignore
-            
-            if not task_raw: 
+            await release_delayed_jobs(redis_client)
+            if time.time() - last_heartbeat >= JOB_HEARTBEAT_INTERVAL:
+                await refresh_in_flight_jobs(redis_client, list(active.values()))
+                last_heartbeat = time.time()
+            free = ONBOARDING_CONCURRENCY - len(active)
+            if free <= 0:
+                await asyncio.wait(set(active), timeout=1, return_when=asyncio.FIRST_COMPLETED)
                 continue
-                
-            logging.info(f"📨 Получены raw данные из Redis: {task_raw}")  # ДОБАВИТЬ
-            
-            task = json.loads(task_raw[1])
-            channel_id = int(task.get("channel_id"))
-            chat_id = int(task.get("user_chat_id"))
-            title = task.get("channel_title")
-            
-            logging.info(f"🆕 НОВЫЙ КАНАЛ: Обрабатываю канал «{title}» (ID: {channel_id}) для пользователя {chat_id}")
-            
-            async with session_maker() as session:
-                channel = await session.get(Channel, channel_id)
-                if channel:
-                    logging.info(f"📥 Начинаю загрузку постов из «{title}»...")
-                    
-                    entity = await get_cached_entity(channel)
-                    if entity and client is not None:
-                        logging.info(f"🖼️ Загружаю аватар для «{title}»...")
-                        avatar_url = await upload_avatar_to_s3(client, entity)
-                        if avatar_url: 
-                            channel.avatar_url = avatar_url
-                            session.add(channel)
-                            await session.commit()
-                            logging.info(f"✅ Аватар загружен для «{title}»")
-                    
-                    await fetch_posts_for_channel(channel, session, POST_LIMIT)
-                    
-                    # ОТПРАВКА УВЕДОМЛЕНИЯ
-                    completion = {"user_chat_id": chat_id, "channel_title": title}
-                    await redis_publisher.publish("task_completion_notifications", json.dumps(completion))
-                    logging.info(f"🎉 Канал «{title}» обработан, уведомление отправлено пользователю {chat_id}")
-                else:
-                    logging.error(f"❌ Канал с ID {channel_id} не найден в базе данных!")
+            entries = []
+            if time.time() - last_reclaim >= JOB_RECLAIM_INTERVAL:
+                entries, last_reclaim = await reclaim_stale_jobs(redis_client, free), time.time()
+            if not entries:
+                response = await redis_client.xreadgroup(
+                    NEW_CHANNEL_GROUP, WORKER_ID, {NEW_CHANNEL_STREAM: ">"}, count=free, block=1000
+                )
+                entries = [entry for _, stream_entries in response or [] for entry in stream_entries]
+            for entry_id, fields in entries:
+                logging.info(f"📨 Получена задача {entry_id} из Redis")
+                task = asyncio.create_task(run_new_channel_entry(redis_client, entry_id, fields))
+                active[task] = entry_id
+                task.add_done_callback(lambda t: active.pop(t, None))
                     
         except asyncio.CancelledError: 
             logging.info("🛑 Redis listener получил сигнал отмены")
             raise
-        except asyncio.TimeoutError: 
-            continue
-        except json.JSONDecodeError as e:
-            logging.error(f"❌ Ошибка декодирования JSON: {e}")
         except Exception as e:
             logging.error(f"❌ Ошибка в Redis-слушателе: {e}", exc_info=True)
             await worker_stats.increment_errors()
             await asyncio.sleep(1)
     
+    if active:
+        # Незавершенные задачи останутся без ACK и будут забраны повторно
+        _, unfinished = await asyncio.wait(set(active), timeout=30)
+        for task in unfinished:
+            task.cancel()
     logging.info("🛑 Redis listener завершен")
 
 async def main():
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
     
+    # Первым делом, до появления потоков в процессе
+    start_transcode_pool()
+
     await create_db()
     logging.info("Воркер запущен.")
     
-    if not client: 
+    if not telegram_accounts: 
         logging.critical("❌ Telethon клиент не настроен!")
         return
     
@@ -667,14 +1974,29 @@ async def main():
     else:
         logging.info("✅ Redis настроен корректно")
     
-    async with client:
-        logging.info("✅ Клиент Telethon успешно запущен.")
+    async with contextlib.AsyncExitStack() as stack:
+        for account in telegram_accounts:
+            # В воркере все запросы идут через governor: FloodWait обрабатывает он
+            account.client.flood_sleep_threshold = 0
+            await stack.enter_async_context(account.client)
+        logging.info(f"✅ Клиенты Telethon успешно запущены, аккаунтов: {len(telegram_accounts)}")
         
         # Запускаем задачи
         tasks = [
             asyncio.create_task(periodic_tasks_runner(), name="periodic_tasks"),
+            asyncio.create_task(stats_reporter(), name="stats_reporter"),
+            asyncio.create_task(engagement_refresher(), name="engagement_refresher"),
+            asyncio.create_task(backfill_consumer(), name="backfill_consumer"),
         ]
         
+        if PUSH_INGESTION:
+            # Альбомы приходят отдельным событием, поэтому одиночный NewMessage их пропускает
+            for account in telegram_accounts:
+                account.client.add_event_handler(handle_new_message_event, events.NewMessage(func=lambda e: e.is_channel and not e.message.grouped_id))
+                account.client.add_event_handler(handle_album_event, events.Album(func=lambda e: e.is_channel))
+            tasks.append(asyncio.create_task(push_connection_watchdog(), name="push_watchdog"))
+            logging.info("⚡ Push-режим включен: новые посты приходят через update-события")
+
         if redis_publisher:
             tasks.append(asyncio.create_task(listen_for_new_channel_tasks(), name="redis_listener"))
             logging.info("🔄 Запускаю Redis listener...")
@@ -685,6 +2007,9 @@ async def main():
     
     if redis_publisher: 
         await redis_publisher.close()
+    s3_executor.shutdown(wait=True)
+    if transcode_pool:
+        transcode_pool.shutdown(wait=True)
     
     logging.info("✅ Воркер корректно завершил работу.")
 
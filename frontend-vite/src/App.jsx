@@ -272,6 +272,7 @@ function App() {
     const [pageStatus, setPageStatus] = useState('initial_loading'); // 'initial_loading', 'loading_more', 'ready', 'backfilling', 'empty', 'error'
 
     const page = useRef(1);
+    const cursor = useRef(null);
     const loaderRef = useRef(null);
     const isFetchingRef = useRef(false);
     
@@ -283,6 +284,7 @@ function App() {
         
         if (isRefresh) {
             page.current = 1;
+            cursor.current = null;
             setError(null);
             setPosts([]); // Очищаем посты принудительно при обновлении
             setPageStatus('initial_loading');
@@ -291,7 +293,8 @@ function App() {
         }
 
         try {
-            const apiUrl = `https://telegram-feed-app-production.up.railway.app/api/feed/?page=${page.current}`;
+            const query = cursor.current ? `cursor=${encodeURIComponent(cursor.current)}` : `page=${page.current}`;
+            const apiUrl = `https://telegram-feed-app-production.up.railway.app/api/feed/?${query}`;
             const headers = { 'Authorization': `tma ${window.Telegram.WebApp.initData}` };
             
             const response = await fetch(apiUrl, { headers });
@@ -301,7 +304,7 @@ function App() {
                 throw new Error(errorData.detail || 'Ошибка сети');
             }
 
-            const { posts: newPosts, status: apiStatus } = await response.json();
+            const { posts: newPosts, status: apiStatus, next_cursor: nextCursor } = await response.json();
             
             setPosts(prev => {
                 const currentPosts = isRefresh ? [] : prev;
@@ -313,6 +316,7 @@ function App() {
             if (apiStatus === 'ok') {
                 setPageStatus('ready');
                 page.current += 1;
+                cursor.current = nextCursor;
             } else {
                 setPageStatus(apiStatus);
             }